@@ -1,41 +1,68 @@
 import json
 import os
+import tempfile
 import uuid
+import zlib
 from dotenv import load_dotenv
 load_dotenv()  # Load .env file before accessing env vars
 
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session, g
-from curriculum import generate_question, set_translator
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from psycopg2 import pool
+from assets import StaticAssets
+from curriculum import STRANDS, generate_question, set_shape_sprite, set_translator
+from storage import PoolTimeout, WriteBehindQueue, create_storage
+from cache import TTLCache
+from question_pool import QuestionPool, SharedQuestionStore
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from authlib.integrations.flask_client import OAuth
 from werkzeug.middleware.proxy_fix import ProxyFix
-from flask_babel import Babel, gettext as _
+from flask_babel import Babel, force_locale, gettext as _, get_locale as current_locale
 
 app = Flask(__name__)
 # Fix for running behind a reverse proxy (Railway, Heroku, etc.)
 # This ensures url_for generates https:// URLs in production
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-HISTORY_FILE = 'history.json'
-DATABASE_URL = os.environ.get('DATABASE_URL')
-
-# Database connection pool (lazy initialization)
-_db_pool = None
-_db_initialized = False
-
-def get_db_pool():
-    """Get or create the database connection pool."""
-    global _db_pool
-    if _db_pool is None and DATABASE_URL:
-        _db_pool = pool.ThreadedConnectionPool(
-            minconn=1,
-            maxconn=10,
-            dsn=DATABASE_URL
-        )
-    return _db_pool
+# Static files are served under content-hashed names (see assets.py) with a
+# year-long immutable Cache-Control, so repeat visits never revalidate them.
+# Names come from static/asset-manifest.json, written at build time by
+# `python assets.py`. The service worker keeps a fixed URL and is served
+# from / (see below).
+static_assets = StaticAssets(app.static_folder, unhashed={'service-worker.js'}, use_manifest=not app.debug)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+@app.url_defaults
+def hashed_static_url(endpoint, values):
+    """Make url_for('static', filename=...) emit the fingerprinted URL."""
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = static_assets.hashed(values['filename'])
+
+def static_file(filename):
+    original = static_assets.original(filename)
+    if original is None:
+        return app.send_static_file(filename)
+    response = app.send_static_file(original)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+app.view_functions['static'] = static_file
+set_shape_sprite(f"{app.static_url_path}/{static_assets.hashed('shapes.svg')}")
+
+# History/user storage backend, chosen by STORAGE_BACKEND (see storage.py)
+storage = create_storage()
+
+# Optional write-behind mode: sessions are saved in batches off the request thread
+history_queue = None
+if os.environ.get('HISTORY_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes'):
+    history_queue = WriteBehindQueue(
+        storage,
+        maxsize=int(os.environ.get('HISTORY_QUEUE_SIZE', 1000)),
+        batch_size=int(os.environ.get('HISTORY_BATCH_SIZE', 50)),
+        flush_interval=float(os.environ.get('HISTORY_FLUSH_INTERVAL', 0.2)),
+        retry_max_delay=float(os.environ.get('HISTORY_RETRY_MAX_DELAY', 30)),
+    )
 
 # Flask-Babel configuration for i18n
 app.config['BABEL_DEFAULT_LOCALE'] = 'en'
@@ -50,13 +77,96 @@ def get_locale():
 
 babel = Babel(app, locale_selector=get_locale)
 
-# Set the translator for curriculum.py to use
-set_translator(_)
+# Set the translator for curriculum.py to use, memoized per locale
+set_translator(_, current_locale)
+
+# Payload formats for /api/get_question(s): full HTML, or structured payloads
+# whose static fragments the quiz page renders itself
+QUESTION_FORMATS = ('html', 'structured')
+
+def generate_in_locale(strand, locale, fmt='html'):
+    """Generate a question outside a request, rendered in the given locale."""
+    with app.app_context(), force_locale(locale):
+        return generate_question(strand, structured=fmt == 'structured')
+
+# Optional pools of pre-generated questions, one per (strand, locale, format).
+# QUESTION_POOL=1 keeps a pool per worker, topped up by a background thread;
+# QUESTION_POOL=shared keeps one memory-mapped store filled by a single
+# worker and read by all of them
+question_pool = None
+_pool_mode = os.environ.get('QUESTION_POOL', '').lower()
+# Only pool the formats clients ask for (the quiz page uses structured);
+# other formats are generated per request
+_pool_formats = [fmt for fmt in os.environ.get('QUESTION_POOL_FORMATS', 'structured').split(',')
+                 if fmt in QUESTION_FORMATS]
+_pool_keys = [(strand, locale, fmt) for strand in STRANDS
+              for locale in app.config['BABEL_SUPPORTED_LOCALES'] for fmt in _pool_formats]
+if _pool_mode == 'shared':
+    question_pool = SharedQuestionStore(
+        generate_in_locale,
+        _pool_keys,
+        # One store per app checkout; the store appends a layout checksum
+        path=os.environ.get('QUESTION_POOL_PATH', os.path.join(
+            '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+            f"math-questions-{zlib.crc32(app.root_path.encode()):08x}")),
+        slots=int(os.environ.get('QUESTION_POOL_SIZE', 64)),
+        slot_size=int(os.environ.get('QUESTION_POOL_SLOT_BYTES', 4096)),
+        refill_rate=float(os.environ.get('QUESTION_POOL_REFILL_RATE', 200)),
+        # Pooled seeds are saved with the current layouts, so questions from
+        # a build with different layouts must never be served
+        version=repr(sorted((name, space.layout) for name, space in STRANDS.items())),
+    )
+elif _pool_mode in ('1', 'true', 'yes'):
+    question_pool = QuestionPool(
+        generate_in_locale,
+        _pool_keys,
+        size=int(os.environ.get('QUESTION_POOL_SIZE', 50)),
+        low_water=int(os.environ.get('QUESTION_POOL_LOW_WATER', 10)),
+        refill_rate=float(os.environ.get('QUESTION_POOL_REFILL_RATE', 200)),
+    )
+
+def next_question_index(strand):
+    """Next index in this session's no-repeat walk over the strand's questions.
+
+    The walk's state is a permutation key and one counter per mode, kept in
+    the session cookie.
+    """
+    generator = STRANDS[strand]
+    order = session.setdefault('question_order', {}).setdefault(strand, generator.new_order())
+    index = generator.next_in_order(order)
+    session.modified = True
+    return index
+
+def question_format():
+    """Payload format requested with ?format=, defaulting to full HTML."""
+    fmt = request.args.get('format', 'html')
+    return fmt if fmt in QUESTION_FORMATS else 'html'
+
+def next_question_json(strand, fmt='html'):
+    """Next question for the current locale, as JSON bytes."""
+    if question_pool:
+        # Pools trade the per-session no-repeat order for pre-rendered questions
+        return question_pool.get_json(strand, g.locale, fmt)
+    question = generate_question(strand, seed=next_question_index(strand), structured=fmt == 'structured')
+    return json.dumps(question).encode()
 
 @app.before_request
 def before_request():
     g.locale = get_locale()
 
+# Pages showing a particular child's data; never stored by browsers or the
+# service worker, which serves cached pages on shared classroom tablets
+PRIVATE_ENDPOINTS = {'history', 'review_session'}
+
+@app.after_request
+def private_pages(response):
+    # Checks the session rather than current_user: loading the user here
+    # would hit storage again, and turn a busy pool's 503 into a 500
+    if response.mimetype == 'text/html' and (
+            request.endpoint in PRIVATE_ENDPOINTS or '_user_id' in session):
+        response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
 # Flask-Login setup
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -83,165 +193,96 @@ class User(UserMixin):
         self.name = name
         self.picture = picture
 
+# Per-worker cache of User objects, so most requests skip the users query
+user_cache = TTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('USER_CACHE_TTL', 300)),
+)
+
 @login_manager.user_loader
 def load_user(user_id):
-    if not DATABASE_URL:
-        return None
-    conn = get_db_connection()
-    if not conn:
-        return None
-    try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute('SELECT id, google_id, email, name, picture FROM users WHERE id = %s', (user_id,))
-        row = cur.fetchone()
-        cur.close()
-        if row:
-            return User(row['id'], row['google_id'], row['email'], row['name'], row['picture'])
+    user = user_cache.get(str(user_id))
+    if user is not None:
+        return user
+    row = storage.load_user(user_id)
+    if not row:
         return None
-    finally:
-        release_db_connection(conn)
-
-# Valid strands for input validation
-VALID_STRANDS = {
-    'number', 'algebra', 'spatial', 'data', 'financial', 'coding',
-    'placevalue', 'time', 'measurement', 'wordproblems', 'comparing', 'skipcounting'
-}
-
-def get_db_connection():
-    """Get a connection from the pool."""
-    db_pool = get_db_pool()
-    if db_pool:
-        conn = db_pool.getconn()
-        # Set cursor factory for this connection
-        return conn
-    return None
-
-def release_db_connection(conn):
-    """Return a connection to the pool."""
-    db_pool = get_db_pool()
-    if db_pool and conn:
-        db_pool.putconn(conn)
+    user = User(**row)
+    user_cache.set(str(user_id), user)
+    return user
+
+# Valid strands for input validation (live view of the curriculum registry)
+VALID_STRANDS = STRANDS.keys()
 
 def init_db():
-    """Initialize database tables. Only runs once per process."""
-    global _db_initialized
-    if _db_initialized or not DATABASE_URL:
-        return
-
-    conn = get_db_connection()
-    if not conn:
-        return
-
-    try:
-        cur = conn.cursor()
-        # Users table
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                google_id TEXT UNIQUE NOT NULL,
-                email TEXT NOT NULL,
-                name TEXT,
-                picture TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        # History table
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS history (
-                id TEXT PRIMARY KEY,
-                data JSONB NOT NULL,
-                user_id INTEGER REFERENCES users(id),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        # Add user_id column if it doesn't exist (for existing tables)
-        cur.execute('''
-            DO $$
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM information_schema.columns
-                               WHERE table_name='history' AND column_name='user_id') THEN
-                    ALTER TABLE history ADD COLUMN user_id INTEGER REFERENCES users(id);
-                END IF;
-            END $$;
-        ''')
-        cur.execute('CREATE INDEX IF NOT EXISTS idx_history_user_id ON history(user_id)')
-        conn.commit()
-        cur.close()
-        _db_initialized = True
-    finally:
-        release_db_connection(conn)
-
-def load_history(user_id=None):
-    if not DATABASE_URL:
-        if not os.path.exists(HISTORY_FILE):
-            return []
-        with open(HISTORY_FILE, 'r') as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return []
-    conn = get_db_connection()
-    if not conn:
-        return []
-    try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        if user_id:
-            cur.execute('SELECT data FROM history WHERE user_id = %s ORDER BY created_at DESC', (user_id,))
-        else:
-            cur.execute('SELECT data FROM history WHERE user_id IS NULL ORDER BY created_at DESC')
-        rows = cur.fetchall()
-        cur.close()
-        return [row['data'] for row in rows]
-    finally:
-        release_db_connection(conn)
+    """Check the storage schema version. Only runs once per process."""
+    storage.init()
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations (run once per deploy)."""
+    version = storage.migrate()
+    print(f"Schema is at version {version}")
+
+def load_history(user_id=None, before=None, limit=None, summary=False):
+    return storage.load_history(user_id, before=before, limit=limit, summary=summary)
+
+def get_history_record(session_id, user_id=None):
+    return storage.get_history_record(session_id, user_id)
 
 def save_history(record, user_id=None):
-    if not DATABASE_URL:
-        history = load_history()
-        history.append(record)
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump(history, f)
-        return
-    conn = get_db_connection()
-    if not conn:
-        return
-    try:
-        cur = conn.cursor()
-        cur.execute('INSERT INTO history (id, data, user_id) VALUES (%s, %s, %s)',
-                    (record['id'], json.dumps(record), user_id))
-        conn.commit()
-        cur.close()
-    finally:
-        release_db_connection(conn)
+    if history_queue:
+        history_queue.put(record, user_id)
+    else:
+        storage.save_history(record, user_id)
 
 def get_or_create_user(google_id, email, name, picture):
-    if not DATABASE_URL:
-        # For local dev without DB, create a simple user object
-        # Use google_id hash as a simple numeric ID
-        user_id = abs(hash(google_id)) % 1000000
-        return User(user_id, google_id, email, name, picture)
-
-    conn = get_db_connection()
-    if not conn:
-        return None
-    try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute('SELECT id, google_id, email, name, picture FROM users WHERE google_id = %s', (google_id,))
-        row = cur.fetchone()
-        if row:
-            user = User(row['id'], row['google_id'], row['email'], row['name'], row['picture'])
-        else:
-            cur.execute(
-                'INSERT INTO users (google_id, email, name, picture) VALUES (%s, %s, %s, %s) RETURNING id',
-                (google_id, email, name, picture)
-            )
-            user_id = cur.fetchone()['id']
-            conn.commit()
-            user = User(user_id, google_id, email, name, picture)
-        cur.close()
-        return user
-    finally:
-        release_db_connection(conn)
+    user = User(**storage.get_or_create_user(google_id, email, name, picture))
+    # The upsert returns the current row, so the callback redirect's first
+    # load_user is served from the cache. Backends without a user table
+    # can't load the user back, so caching would only log them in on this
+    # worker until the entry expires.
+    if storage.persists_users:
+        user_cache.set(str(user.id), user)
+    return user
+
+def compact_details(details):
+    """Drop rendered HTML from details that can be regenerated from a seed."""
+    compact = []
+    for item in details:
+        if item.get('seed') is not None:
+            item = {k: item[k] for k in ('seed', 'choice', 'user_ans', 'is_correct') if k in item}
+        compact.append(item)
+    return compact
+
+def render_details(record):
+    """Re-render question HTML for details stored as seed references.
+
+    Questions are regenerated in the locale the session was played in, so the
+    saved answers match the re-rendered options. Answers saved as a `choice`
+    (an option's position, from structured payloads) are rendered back to
+    the option. If the strand's question layout has changed since the
+    session was saved, or the record does not say which layout it used, its
+    seeds may point at different questions, so they are not re-rendered.
+    Returns a new record.
+    """
+    details = []
+    strand = record.get('strand')
+    generator = STRANDS.get(strand)
+    stale = generator is None or record.get('layout') != generator.layout
+    with force_locale(record.get('locale', 'en')):
+        for item in record.get('details', []):
+            if 'q_html' not in item and item.get('seed') is not None and stale:
+                item = dict(item, q_html=_("This question has changed since this session was played."),
+                            user_ans=item.get('user_ans', ''), correct_ans='')
+            elif 'q_html' not in item and item.get('seed') is not None:
+                question = generate_question(strand, seed=item['seed'])
+                item = dict(item, q_html=question['q'], correct_ans=question['a'])
+                choice = item.get('choice')
+                if 'user_ans' not in item and isinstance(choice, int) and 0 <= choice < len(question['options']):
+                    item['user_ans'] = question['options'][choice]
+            details.append(item)
+    return dict(record, details=details)
 
 @app.route('/')
 def index():
@@ -289,22 +330,55 @@ def quiz(strand):
 def api_question(strand):
     if strand not in VALID_STRANDS:
         return jsonify({"error": "Invalid strand"}), 400
-    return jsonify(generate_question(strand))
+    # Optional seed makes the question reproducible
+    seed = request.args.get('seed', type=int)
+    fmt = question_format()
+    if seed is not None:
+        return jsonify(generate_question(strand, seed=seed, structured=fmt == 'structured'))
+    return app.response_class(next_question_json(strand, fmt), mimetype='application/json')
+
+# Upper bound on questions returned by one batch request
+MAX_QUESTION_BATCH = 50
+
+@app.route('/api/get_questions/<strand>')
+def api_questions(strand):
+    """Return a batch of questions so the quiz page can prefetch ahead."""
+    if strand not in VALID_STRANDS:
+        return jsonify({"error": "Invalid strand"}), 400
+    n = request.args.get('n', 10, type=int)
+    n = max(1, min(n, MAX_QUESTION_BATCH))
+    fmt = question_format()
+    # Pooled questions are already serialised, so splice them together as-is
+    body = b'[' + b','.join(next_question_json(strand, fmt) for _i in range(n)) + b']'
+    return app.response_class(body, mimetype='application/json')
 
 @app.route('/api/save_session', methods=['POST'])
 def save_session_route():
     data = request.json
     # Assign a unique ID for the review link
     data['id'] = str(uuid.uuid4())
+    data['locale'] = g.locale
+    # Seeds only mean something against the strand's current question layout
+    generator = STRANDS.get(data.get('strand'))
+    if generator is not None:
+        data['layout'] = generator.layout
+    data['details'] = compact_details(data.get('details', []))
     user_id = current_user.id if current_user.is_authenticated else None
     save_history(data, user_id)
     return jsonify({"status": "success"})
 
+# Sessions shown per page on /history
+HISTORY_PAGE_SIZE = 20
+
 @app.route('/history')
 def history():
     user_id = current_user.id if current_user.is_authenticated else None
-    data = load_history(user_id)
-    return render_template('history.html', history=data, user=current_user)
+    before = request.args.get('before')
+    data, next_cursor = load_history(user_id, before=before, limit=HISTORY_PAGE_SIZE, summary=True)
+    if request.args.get('fragment'):
+        # "Load more" requests only need the extra cards
+        return render_template('_history_cards.html', history=data, next_cursor=next_cursor)
+    return render_template('history.html', history=data, next_cursor=next_cursor, user=current_user)
 
 @app.route('/review/<session_id>')
 def review_session(session_id):
@@ -313,15 +387,75 @@ def review_session(session_id):
         return render_template('review.html', session=None, user=current_user, is_local=True)
 
     user_id = current_user.id if current_user.is_authenticated else None
-    history_data = load_history(user_id)
-    # Find the specific session by ID
-    session_data = next((item for item in history_data if item.get('id') == session_id), None)
+    session_data = get_history_record(session_id, user_id)
 
     if not session_data:
         return "Session not found", 404
+    session_data = render_details(session_data)
 
     return render_template('review.html', session=session_data, user=current_user, is_local=False)
 
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(error):
+    """Shed load with a fast 503 when every database connection is busy."""
+    headers = {'Retry-After': os.environ.get('DB_POOL_RETRY_AFTER', '2')}
+    if request.path.startswith('/api/'):
+        return jsonify({"error": "Server busy, please retry"}), 503, headers
+    return "Server busy, please retry in a moment", 503, headers
+
+# The service worker, prefixed with the asset version and the hashed asset
+# URLs it precaches. It is served from / so its scope covers every page, and
+# revalidated on each navigation since it names the current asset versions
+with open(os.path.join(app.static_folder, 'service-worker.js'), 'rb') as f:
+    SERVICE_WORKER = (
+        f'const ASSETS_VERSION = {json.dumps(static_assets.version)};\n'
+        f'const PRECACHE_URLS = {json.dumps(static_assets.urls(app.static_url_path))};\n'
+    ).encode() + f.read()
+
+@app.route('/service-worker.js')
+def service_worker():
+    response = app.response_class(SERVICE_WORKER, mimetype='application/javascript')
+    response.cache_control.no_cache = True
+    return response
+
+# Browsers that registered the worker under its old /static/ URL keep
+# checking that URL for updates. The raw source would fail to run there, so
+# they get a worker that removes its cache and unregisters itself
+RETIRED_SERVICE_WORKER = b"""\
+self.addEventListener('install', () => self.skipWaiting());
+self.addEventListener('activate', (event) => {
+  event.waitUntil(caches.delete('math-adventure-v1').then(() => self.registration.unregister()));
+});
+"""
+
+@app.route('/static/service-worker.js')
+def retired_service_worker():
+    response = app.response_class(RETIRED_SERVICE_WORKER, mimetype='application/javascript')
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the worker is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness from in-memory pool state; never runs a query."""
+    ready = storage.ready()
+    body = {"status": "ready" if ready else "unavailable", **storage.stats()}
+    return jsonify(body), 200 if ready else 503
+
+@app.route('/metrics')
+def metrics():
+    """Per-worker runtime counters, as JSON."""
+    data = {'user_cache': user_cache.stats(), **storage.stats()}
+    if history_queue:
+        data['history_queue'] = history_queue.stats()
+    if question_pool:
+        data['question_pool'] = question_pool.stats()
+    return jsonify(data)
+
 if __name__ == '__main__':
     init_db()
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Written into the static folder by `python assets.py` at build time
+MANIFEST = 'asset-manifest.json'
+
+
+def _asset_files(folder, unhashed=()):
+    """{name: path} for the files in `folder` that get hashed names."""
+    files = {}
+    for root, _dirs, names in os.walk(folder):
+        for file in names:
+            path = os.path.join(root, file)
+            name = os.path.relpath(path, folder).replace(os.sep, '/')
+            if name not in unhashed and name != MANIFEST:
+                files[name] = path
+    return files
+
+
+def build_manifest(folder, unhashed=(), digest_size=10):
+    """Hash every file in `folder`: {"version": ..., "assets": {name: hashed name}}.
+
+    The version is a digest of all the hashed names, so it changes whenever
+    any asset does.
+    """
+    assets = {}
+    for name, path in _asset_files(folder, unhashed).items():
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:digest_size]
+        base, ext = os.path.splitext(name)
+        assets[name] = f'{base}.{digest}{ext}'
+    version = hashlib.sha256(json.dumps(assets, sort_keys=True).encode()).hexdigest()[:digest_size]
+    return {'version': version, 'assets': assets}
+
+
+class StaticAssets:
+    """Content-hashed names for the files in a static folder.
+
+    style.css is published as style.<digest>.css, where the digest is taken
+    from the file's bytes: a hashed URL always names the same content, so it
+    can be cached forever, and editing a file gives it a new URL. Files in
+    `unhashed` (such as the service worker, whose URL must not change) keep
+    their plain names.
+
+    Names come from the build-generated asset-manifest.json when it is
+    current: it lists exactly the files present and none was modified after
+    it was written. Otherwise, and always with use_manifest=False (debug
+    mode), the folder is hashed at startup, so an edited file never keeps
+    being served under its old immutable URL.
+    """
+
+    def __init__(self, folder, unhashed=(), digest_size=10, use_manifest=True):
+        self.folder = folder
+        manifest = self._load_manifest(unhashed) if use_manifest else None
+        if manifest is None:
+            manifest = build_manifest(folder, unhashed, digest_size)
+        self.version = manifest['version']
+        self._hashed = manifest['assets']  # name -> hashed name
+        self._original = {hashed: name for name, hashed in self._hashed.items()}
+
+    def _load_manifest(self, unhashed):
+        path = os.path.join(self.folder, MANIFEST)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            manifest = json.load(f)
+        files = _asset_files(self.folder, unhashed)
+        built = os.path.getmtime(path)
+        if set(files) != set(manifest['assets']) or any(os.path.getmtime(p) > built for p in files.values()):
+            logger.warning('%s is out of date with %s; hashing assets at startup '
+                           '(re-run `python assets.py`)', MANIFEST, self.folder)
+            return None
+        return manifest
+
+    def hashed(self, name):
+        """Hashed name for a static file, or the name itself if not hashed."""
+        return self._hashed.get(name, name)
+
+    def original(self, hashed):
+        """The file a hashed name refers to, or None."""
+        return self._original.get(hashed)
+
+    def urls(self, prefix='/static'):
+        """Hashed URLs of every asset, e.g. for a service worker to precache."""
+        return [f'{prefix}/{hashed}' for hashed in sorted(self._original)]
+
+
+if __name__ == '__main__':
+    # Build step: python assets.py [static folder]
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    manifest = build_manifest(folder, unhashed={'service-worker.js'})
+    with open(os.path.join(folder, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    print(f"Wrote {MANIFEST}: {len(manifest['assets'])} assets, version {manifest['version']}")
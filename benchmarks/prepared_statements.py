@@ -0,0 +1,87 @@
+"""Compare the hot Postgres queries with and without prepared statements.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/prepared_statements.py [iterations] [threads]
+
+Seeds a throwaway user with some history, then times each hot query through
+PostgresStorage with use_prepared off and on. With threads > 1 the calls are
+spread over that many threads sharing one pool, as under gunicorn, and the
+time reported is wall-clock per call. Rows written by the benchmark are
+deleted afterwards.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import PostgresStorage  # noqa: E402
+
+
+def timed(fn, iterations, threads=1):
+    """Average wall-clock microseconds per call, over `threads` threads."""
+    fn()  # warm up (and PREPARE, on the prepared path)
+
+    def run():
+        for _i in range(iterations // threads):
+            fn()
+
+    workers = [threading.Thread(target=run) for _t in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (iterations // threads * threads) * 1e6
+
+
+def main():
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit("Set DATABASE_URL to a Postgres database to benchmark against.")
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    plain = PostgresStorage(dsn, use_prepared=False)
+    prepared = PostgresStorage(dsn, use_prepared=True)
+    plain.init()
+    prepared.init()
+
+    google_id = f'bench-{uuid.uuid4()}'
+    user = plain.get_or_create_user(google_id, 'bench@example.com', 'Bench', None)
+    for i in range(50):
+        plain.save_history({'id': f'{google_id}-{i}', 'date': 'today', 'strand': 'number',
+                            'score_str': '8/10', 'percent': 80, 'details': []}, user['id'])
+    _page, cursor = plain.load_history(user['id'], limit=20, summary=True)
+    record_id = f'{google_id}-25'
+
+    def insert(storage):
+        storage.save_history({'id': str(uuid.uuid4()), 'details': []}, user['id'])
+
+    operations = [
+        ('load_user', lambda s: s.load_user(user['id'])),
+        ('get_or_create_user', lambda s: s.get_or_create_user(google_id, 'bench@example.com', 'Bench', None)),
+        ('history page', lambda s: s.load_history(user['id'], limit=20, summary=True)),
+        ('history page 2', lambda s: s.load_history(user['id'], before=cursor, limit=20, summary=True)),
+        ('history record', lambda s: s.get_history_record(record_id, user['id'])),
+        ('save_history', insert),
+    ]
+
+    print(f"{'query':<20} {'plain µs':>10} {'prepared µs':>12} {'speedup':>8}")
+    try:
+        for label, op in operations:
+            plain_us = timed(lambda: op(plain), iterations, threads)
+            prepared_us = timed(lambda: op(prepared), iterations, threads)
+            print(f"{label:<20} {plain_us:>10.1f} {prepared_us:>12.1f} {plain_us / prepared_us:>7.2f}x")
+    finally:
+        with plain.connection() as conn:
+            cur = conn.cursor()
+            cur.execute('DELETE FROM history WHERE user_id = %s', (user['id'],))
+            cur.execute('DELETE FROM users WHERE id = %s', (user['id'],))
+            conn.commit()
+            cur.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Measure question generation throughput per strand and locale.
+
+Usage: python benchmarks/question_generation.py [iterations]
+
+Generates questions the way the app does (Flask-Babel translator, inside
+force_locale) and prints questions/sec for each strand in each supported
+locale. Uses a throwaway SQLite database so no real storage is touched.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('STORAGE_BACKEND', 'sqlite')
+os.environ.setdefault('SQLITE_PATH', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from flask_babel import force_locale  # noqa: E402
+
+from app import app  # noqa: E402
+from curriculum import STRANDS, generate_question  # noqa: E402
+
+
+def rate(strand, iterations):
+    """Questions per second for one strand, after a warm-up pass."""
+    size = STRANDS[strand].size
+    for seed in range(size):
+        generate_question(strand, seed=seed)
+    start = time.perf_counter()
+    for i in range(iterations):
+        generate_question(strand, seed=i % size)
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    locales = app.config['BABEL_SUPPORTED_LOCALES']
+    print(f"{'strand':<14}" + ''.join(f"{locale + ' q/s':>12}" for locale in locales))
+    totals = dict.fromkeys(locales, 0.0)
+    with app.app_context():
+        for strand in STRANDS:
+            row = f"{strand:<14}"
+            for locale in locales:
+                with force_locale(locale):
+                    qps = rate(strand, iterations)
+                totals[locale] += 1 / qps
+                row += f"{qps:>12.0f}"
+            print(row)
+    # Harmonic mean: throughput of a workload spread evenly over the strands
+    print(f"{'all strands':<14}" + ''.join(f"{len(STRANDS) / totals[locale]:>12.0f}" for locale in locales))
+
+
+if __name__ == '__main__':
+    main()
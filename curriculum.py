@@ -1,71 +1,346 @@
+import bisect
+import functools
+import itertools
+import math
 import random
+import threading
+import zlib
 
 # Translation function - will be set by app.py when Flask app context is available
 # This avoids importing Flask-Babel at module load time which causes slowness
 _translate = None
+_current_locale = None
 
-def set_translator(translator_func):
-    """Called by app.py to set the translation function."""
-    global _translate
+# locale -> {msgid: translation}, filled as strings are first used
+_translations = {}
+
+# Per-call state bound while generate_question runs: the current locale's
+# translations, and whether fragments are emitted as placeholders
+_active = threading.local()
+
+# Where the shape sprite is served from; app.py points this at the
+# fingerprinted URL
+SHAPE_SPRITE = '/static/shapes.svg'
+
+def set_translator(translator_func, locale_func=None):
+    """Called by app.py to set the translation function.
+
+    With locale_func (returning the active locale), translations are
+    memoized per locale, so each string goes through gettext once per locale.
+    """
+    global _translate, _current_locale
     _translate = translator_func
+    _current_locale = locale_func
+    _translations.clear()
+
+def _catalog():
+    """Memoized translations for the current locale."""
+    locale = _current_locale()
+    cache = _translations.get(locale)
+    if cache is None:
+        cache = _translations.setdefault(locale, {})
+    return cache
 
 def _(text):
     """Translate text if translator is available, otherwise return as-is."""
-    if _translate is not None:
-        return _translate(text)
+    if _translate is None:
+        return text
+    cache = getattr(_active, 'catalog', None)
+    if cache is None:
+        if _current_locale is None:
+            return _translate(text)
+        cache = _catalog()
+    translated = cache.get(text)
+    if translated is None:
+        translated = cache[text] = _translate(text)
+    return translated
+
+def set_shape_sprite(url):
+    """Called by app.py to set the URL shape SVGs reference the sprite by."""
+    global SHAPE_SPRITE
+    SHAPE_SPRITE = url
+    _shape_svg.cache_clear()
+
+def N_(text):
+    """Mark a string in a static table for translation; _() is applied on use."""
     return text
 
-def generate_question(strand):
-    """Generates a random question based on Ontario Gr 1 Curriculum strands."""
-    if strand == 'coding':
-        engine = CodingMaze()
-        return engine.generate()
-    elif strand == 'financial':
-        return MoneyCounting().generate()
-    elif strand == 'placevalue':
-        return PlaceValueQuestions().generate()
-    elif strand == 'time':
-        return TimeTellingQuestions().generate()
-    elif strand == 'measurement':
-        return MeasurementQuestions().generate()
-    elif strand == 'wordproblems':
-        return WordProblemQuestions().generate()
-    elif strand == 'comparing':
-        return ComparingQuestions().generate()
-    elif strand == 'skipcounting':
-        return SkipCountingQuestions().generate()
-
-    # --- STRAND B: NUMBER (Addition/Subtraction to 50) ---
-    elif strand == 'number':
-        op = random.choice(['+', '-'])
-        if op == '+':
-            a = random.randint(1, 25)
-            b = random.randint(1, 25)
-            question = _("What is") + f" {a} + {b}?"
-            answer = a + b
-            options = [answer, answer + random.randint(1, 3), answer - random.randint(1, 3)]
-        else:
-            a = random.randint(10, 50)
-            b = random.randint(1, a)  # Ensure positive result
-            question = _("What is") + f" {a} - {b}?"
-            answer = a - b
-            options = [answer, answer + random.randint(1, 5), answer - random.randint(1, 5)]
+# Registry of strand name -> long-lived generator instance.
+# Populated by the @register_strand decorator on each generator class below.
+STRANDS = {}
+
+def register_strand(name):
+    """Class decorator that registers a single shared generator for a strand.
+
+    Generators must be stateless between calls, since one instance serves
+    every request in the process.
+    """
+    def decorator(cls):
+        STRANDS[name] = cls()
+        return cls
+    return decorator
+
+def generate_question(strand, seed=None, structured=False):
+    """Generates a random question based on Ontario Gr 1 Curriculum strands.
+
+    Every question a strand can ask has an index in range(generator.size),
+    and `seed` is that index: the same (strand, seed, locale) always yields
+    the same question. When no seed is given one is sampled; it is returned
+    in the payload as "seed" and doubles as the question's id.
+
+    With structured=True, static fragments (shapes, clocks, mazes, coins,
+    base-10 blocks) are left as <i data-f data-p> placeholders for the quiz
+    page to render, and "a" is the answer's position in "options".
+    """
+    generator = STRANDS.get(strand)
+    if generator is None:
+        return {"q": "Unknown strand", "a": "", "options": [], "strand": "Error"}
+    if seed is None:
+        seed = generator.sample()
+    seed %= generator.size
+    # Look the locale up once per question rather than once per string
+    _active.catalog = _catalog() if _current_locale is not None else None
+    _active.structured = structured
+    try:
+        question = generator.question(seed)
+    finally:
+        _active.catalog = None
+        _active.structured = False
+    question["seed"] = seed
+    if structured:
+        # Options are identified by position; answers are compared by id
+        question["a"] = [str(opt) for opt in question["options"]].index(str(question["a"]))
+    return question
+
+
+def _fragment(kind, render, *params):
+    """A static fragment: render(*params), or a placeholder naming the
+    fragment and its parameters when building a structured payload."""
+    if getattr(_active, 'structured', False):
+        return f"<i data-f='{kind}' data-p='{','.join(str(p) for p in params)}'></i>"
+    return render(*params)
+
+
+@functools.lru_cache(maxsize=None)
+def _shape_svg(symbol, width, height):
+    """An <svg> showing one symbol from the shape sprite."""
+    return f'<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}"><use href="{SHAPE_SPRITE}#{symbol}"/></svg>'
+
+
+def _shape(spec):
+    """Shape fragment for a (sprite symbol, width, height) spec."""
+    return _fragment('shape', _shape_svg, *spec)
+
+
+# Per-thread generators for sampling, so threads share no RNG state
+_rngs = threading.local()
+
+# Session permutation keys come from the OS and need no shared state either
+_system_random = random.SystemRandom()
+
+
+def _thread_rng():
+    """This thread's random.Random, seeded from the OS on first use."""
+    rng = getattr(_rngs, 'rng', None)
+    if rng is None:
+        rng = _rngs.rng = random.Random()
+    return rng
+
+
+def _mix(index):
+    """Cheap 32-bit hash of a question index.
+
+    Picks the cosmetic parts of a question (distractors, emoji, option
+    order) so they vary between questions without any RNG state.
+    """
+    x = (index * 0x9E3779B1 + 0x7F4A7C15) & 0xFFFFFFFF
+    x ^= x >> 15
+    x = (x * 0x2C1B3C6D) & 0xFFFFFFFF
+    x ^= x >> 12
+    return x
+
+
+def _permute(x, n, key):
+    """Position x of a keyed pseudo-random permutation of range(n).
+
+    A 4-round balanced Feistel network over the smallest even bit width
+    covering n, cycle-walking until the result lands back inside range(n).
+    """
+    bits = max(2, (n - 1).bit_length() + 1 & ~1)
+    half = bits // 2
+    mask = (1 << half) - 1
+    while True:
+        left, right = x >> half, x & mask
+        for r in range(4):
+            left, right = right, left ^ (_mix(key + (r << 24) + right) & mask)
+        x = (left << half) | right
+        if x < n:
+            return x
+
+
+def _pair_below(k, lo):
+    """The k-th pair (a, b) with a >= lo and 1 <= b <= a, ordered by a then b."""
+    t = k + lo * (lo - 1) // 2
+    a = (1 + math.isqrt(1 + 8 * t)) // 2
+    return a, t - a * (a - 1) // 2 + 1
+
+
+def _ordered(options, k):
+    """Return options in their k-th ordering (every ordering for k < n!)."""
+    pool = list(options)
+    ordered = []
+    while pool:
+        k, j = divmod(k, len(pool))
+        ordered.append(pool.pop(j))
+    return ordered
+
+
+def _unique(options, answer):
+    """Deduplicate options, making sure the answer is included."""
+    seen = set()
+    unique_options = []
+    for opt in options:
+        opt_str = str(opt)
+        if opt_str not in seen:
+            seen.add(opt_str)
+            unique_options.append(opt)
+    # Ensure correct answer is always included
+    if str(answer) not in seen:
+        unique_options.append(answer)
+    return unique_options
+
+
+class QuestionSpace:
+    """Base for generators whose questions can be enumerated.
+
+    Subclasses list their modes in CASES as (method name, count, weight).
+    The modes' questions are numbered back to back, so each question has an
+    index in range(size) and question(index) builds it directly: sampling is
+    a weighted mode pick plus one randrange, and range(size) iterates every
+    question the strand can ask. Mode methods take the index within the mode
+    and _mix() of the global index.
+
+    Saved sessions refer to questions by index, so `layout` fingerprints
+    everything that decides what an index means: CASES and the other
+    upper-case class tables, plus REVISION, which must be bumped whenever a
+    mode method changes how it turns an index into a question.
+    """
+
+    CASES = ()
+    REVISION = 1
+
+    def __init__(self):
+        self._modes = []
+        self._offsets = []
+        offset = 0
+        for name, count, _weight in self.CASES:
+            self._modes.append((offset, count, getattr(self, name)))
+            self._offsets.append(offset)
+            offset += count
+        self.size = offset
+        self._weights = list(itertools.accumulate(weight for _name, _count, weight in self.CASES))
+        tables = [(name, getattr(self, name)) for name in sorted(dir(type(self))) if name.isupper()]
+        self.layout = f'{zlib.crc32(repr(tables).encode()):08x}'
+
+    def sample(self, rng=None):
+        """Pick a random question index, choosing the mode by weight."""
+        rng = rng or _thread_rng()
+        mode = bisect.bisect(self._weights, rng.random() * self._weights[-1])
+        offset, count, _method = self._modes[mode]
+        return offset + rng.randrange(count)
+
+    def new_order(self):
+        """Sampling state for one session: a permutation key and a counter per mode."""
+        return [_system_random.getrandbits(32)] + [0] * len(self._modes)
+
+    def next_in_order(self, order, rng=None):
+        """Next question index for a session, never repeating until all are seen.
+
+        Each mode walks its own keyed permutation, and the mode is picked by
+        weight among those with questions left. Once every mode has run out
+        the counters reset under a new key. Updates `order` in place.
+        """
+        rng = rng or _thread_rng()
+        if len(order) != len(self._modes) + 1:
+            order[:] = self.new_order()
+        left = [mode for mode, (_offset, count, _method) in enumerate(self._modes) if order[1 + mode] < count]
+        if not left:
+            order[:] = [_mix(order[0])] + [0] * len(self._modes)
+            left = range(len(self._modes))
+        weights = list(itertools.accumulate(self.CASES[mode][2] for mode in left))
+        mode = left[bisect.bisect(weights, rng.random() * weights[-1])]
+        offset, count, _method = self._modes[mode]
+        position = order[1 + mode]
+        order[1 + mode] += 1
+        return offset + _permute(position, count, _mix(order[0] + mode))
+
+    def question(self, index):
+        offset, _count, method = self._modes[bisect.bisect(self._offsets, index) - 1]
+        return method(index - offset, _mix(index))
+
+    def generate(self, rng=None):
+        return self.question(self.sample(rng))
+
+
+@register_strand('number')
+class NumberQuestions(QuestionSpace):
+    """Grade 1 Number: Addition/Subtraction to 50"""
+
+    CASES = (
+        ('_addition', 25 * 25, 1),
+        ('_subtraction', 1230, 1),  # a in 10..50, 1 <= b <= a
+    )
+    EMOJIS = ['🍎', '⭐', '🐸', '🍪']
+
+    def _addition(self, i, mix):
+        a, b = 1 + i % 25, 1 + i // 25
+        answer = a + b
+        options = [answer, answer + 1 + mix % 3, answer - 1 - mix // 3 % 3]
+        return self._question(a, b, '+', answer, options, mix // 9)
+
+    def _subtraction(self, i, mix):
+        a, b = _pair_below(i, 10)  # Ensure positive result
+        answer = a - b
+        options = [answer, answer + 1 + mix % 5, answer - 1 - mix // 5 % 5]
+        return self._question(a, b, '-', answer, options, mix // 25)
+
+    def _question(self, a, b, op, answer, options, mix):
+        question = _("What is") + f" {a} {op} {b}?"
 
         # Visual Aid (Emojis) for smaller numbers
         if a <= 10 and b <= 10:
-            emoji = random.choice(['🍎', '⭐', '🐸', '🍪'])
-            question += f"<br><span style='font-size:2rem'>{' '.join([emoji]*a)} &nbsp;{op}&nbsp; {' '.join([emoji]*b)}</span>"
+            emoji = self.EMOJIS[mix % 4]
+            question += f"<br><span class='q-lg'>{' '.join([emoji]*a)} &nbsp;{op}&nbsp; {' '.join([emoji]*b)}</span>"
+
+        return {
+            "type": "number",
+            "q": question,
+            "a": answer,
+            "options": _ordered(_unique(options, answer), mix // 4),
+            "strand": "Number"
+        }
+
 
-    # --- STRAND C: ALGEBRA (Patterns & Equalities) ---
-    elif strand == 'algebra':
-        return AlgebraQuestions().generate()
+@register_strand('data')
+class DataQuestions(QuestionSpace):
+    """Grade 1 Data: Sorting & simple graphs"""
 
-    # --- STRAND D: DATA (Sorting & Graphs) ---
-    elif strand == 'data':
+    GROUPS = [(N_('Cats'), '🐱'), (N_('Dogs'), '🐶'), (N_('Birds'), '🐦')]
+
+    # Ordered pair of groups (6) x two different counts from 3..9 (7 * 6)
+    CASES = (('_compare', 6 * 42, 1),)
+
+    def _group(self, i):
+        name, emoji = self.GROUPS[i]
+        return _(name) + ' ' + emoji
+
+    def _compare(self, i, mix):
         # Simple Logic: "Which has more?"
-        t1, t2 = random.sample([_('Cats') + ' 🐱', _('Dogs') + ' 🐶', _('Birds') + ' 🐦'], 2)
-        v1, v2 = random.randint(3, 9), random.randint(3, 9)
-        while v1 == v2: v2 = random.randint(3, 9) # Ensure not equal
+        pair, counts = i % 6, i // 6
+        t1 = self._group(pair // 2)
+        t2 = self._group((pair // 2 + 1 + pair % 2) % 3)
+        v1 = 3 + counts % 7
+        v2 = 3 + (counts % 7 + 1 + counts // 7) % 7  # Ensure not equal
 
         # Generate a mini text-graph
         graph = f"{t1}: { '█' * v1 } ({v1})<br>{t2}: { '█' * v2 } ({v2})"
@@ -73,334 +348,317 @@ def generate_question(strand):
         answer = t1 if v1 > v2 else t2
         options = [t1, t2]
 
-    # --- STRAND E: SPATIAL SENSE (Shapes) ---
-    elif strand == 'spatial':
-        return SpatialQuestions().generate()
-
-    # Handle unknown strands
-    else:
-        return {"q": "Unknown strand", "a": "", "options": [], "strand": "Error"}
-
-    # Shuffle and deduplicate options properly
-    random.shuffle(options)
-    seen = set()
-    unique_options = []
-    for opt in options:
-        opt_str = str(opt)
-        if opt_str not in seen:
-            seen.add(opt_str)
-            unique_options.append(opt)
-    # Ensure correct answer is always included
-    if str(answer) not in [str(o) for o in unique_options]:
-        unique_options.append(answer)
-    options = unique_options
-    random.shuffle(options)
-
-    return {
-        "q": question,
-        "a": answer,
-        "options": options,
-        "strand": strand.title()
-    }
+        return {
+            "type": "data",
+            "q": question,
+            "a": answer,
+            "options": _ordered(_unique(options, answer), mix),
+            "strand": "Data"
+        }
 
 
 # ============================================================
 # NEW CURRICULUM STRANDS FOR COMPLETE GRADE 1 COVERAGE
 # ============================================================
 
-class AlgebraQuestions:
+@register_strand('algebra')
+class AlgebraQuestions(QuestionSpace):
     """Grade 1 Algebra: Patterns, growing/shrinking patterns, equalities"""
 
-    def generate(self):
-        mode = random.choice(['pattern_ab', 'pattern_aab', 'pattern_abc', 'growing', 'shrinking', 'missing_number', 'equality'])
-
-        if mode == 'pattern_ab':
-            # Simple AB patterns
-            patterns = [
-                (['🔴', '🔵', '🔴', '🔵', '🔴'], '🔵', ['🔴', '🔵', '🟢']),
-                (['🌙', '⭐', '🌙', '⭐', '🌙'], '⭐', ['🌙', '⭐', '🌟']),
-                (['🐱', '🐶', '🐱', '🐶', '🐱'], '🐶', ['🐱', '🐶', '🐰']),
-                (['▲', '■', '▲', '■', '▲'], '■', ['▲', '■', '●']),
-                (['1', '2', '1', '2', '1'], '2', ['1', '2', '3']),
-            ]
-            pat, correct, opts = random.choice(patterns)
-            display = " ".join(pat) + " <b>?</b>"
-            question = _("What comes next in the pattern?") + f"<br><div style='font-size:2rem;margin:15px 0;'>{display}</div>"
-            options = opts
-            answer = correct
-
-        elif mode == 'pattern_aab':
-            # AAB patterns
-            patterns = [
-                (['🔴', '🔴', '🔵', '🔴', '🔴', '🔵', '🔴', '🔴'], '🔵', ['🔴', '🔵', '🟢']),
-                (['👏', '👏', '🙌', '👏', '👏', '🙌', '👏', '👏'], '🙌', ['👏', '🙌', '✋']),
-                (['🍎', '🍎', '🍊', '🍎', '🍎', '🍊', '🍎', '🍎'], '🍊', ['🍎', '🍊', '🍌']),
-            ]
-            pat, correct, opts = random.choice(patterns)
-            display = " ".join(pat) + " <b>?</b>"
-            question = _("What comes next in the pattern?") + f"<br><div style='font-size:1.8rem;margin:15px 0;'>{display}</div>"
-            options = opts
-            answer = correct
-
-        elif mode == 'pattern_abc':
-            # ABC patterns
-            patterns = [
-                (['🔴', '🔵', '🟢', '🔴', '🔵', '🟢', '🔴', '🔵'], '🟢', ['🔴', '🔵', '🟢']),
-                (['🍎', '🍊', '🍌', '🍎', '🍊', '🍌', '🍎', '🍊'], '🍌', ['🍎', '🍊', '🍌']),
-                (['A', 'B', 'C', 'A', 'B', 'C', 'A', 'B'], 'C', ['A', 'B', 'C']),
-            ]
-            pat, correct, opts = random.choice(patterns)
-            display = " ".join(pat) + " <b>?</b>"
-            question = _("What comes next in the pattern?") + f"<br><div style='font-size:1.8rem;margin:15px 0;'>{display}</div>"
-            options = opts
-            answer = correct
-
-        elif mode == 'growing':
-            # Growing number patterns
-            starts = [
-                ([1, 2, 3, 4], 5, [5, 6, 4]),
-                ([2, 4, 6, 8], 10, [10, 9, 12]),
-                ([5, 10, 15, 20], 25, [25, 22, 30]),
-                ([1, 3, 5, 7], 9, [9, 8, 11]),
-            ]
-            seq, correct, opts = random.choice(starts)
-            display = ", ".join(str(n) for n in seq) + ", <b>?</b>"
-            question = _("What number comes next?") + f"<br><div style='font-size:2rem;margin:15px 0;'>{display}</div>"
-            options = [str(o) for o in opts]
-            answer = str(correct)
-
-        elif mode == 'shrinking':
-            # Shrinking patterns
-            starts = [
-                ([10, 9, 8, 7], 6, [6, 5, 8]),
-                ([20, 18, 16, 14], 12, [12, 10, 13]),
-                ([15, 12, 9, 6], 3, [3, 4, 0]),
-            ]
-            seq, correct, opts = random.choice(starts)
-            display = ", ".join(str(n) for n in seq) + ", <b>?</b>"
-            question = _("The numbers are getting smaller. What comes next?") + f"<br><div style='font-size:2rem;margin:15px 0;'>{display}</div>"
-            options = [str(o) for o in opts]
-            answer = str(correct)
-
-        elif mode == 'missing_number':
-            # Find the missing number in addition
-            a = random.randint(1, 9)
-            b = random.randint(1, 9)
-            total = a + b
-            question = _("Find the missing number:") + f"<br><div style='font-size:2.5rem;margin:15px 0;'>{a} + <b>?</b> = {total}</div>"
-            answer = str(b)
-            options = [str(b), str(b + 1), str(b - 1) if b > 1 else str(b + 2)]
-
-        else:  # equality
-            # Balance/equality
-            a = random.randint(2, 8)
-            b = random.randint(1, a - 1)
-            c = a - b
-            question = _("Make both sides equal:") + f"<br><div style='font-size:2rem;margin:15px 0;'>{a} = {b} + <b>?</b></div>"
-            answer = str(c)
-            options = [str(c), str(c + 1), str(c - 1) if c > 1 else str(c + 2)]
-
-        random.shuffle(options)
+    # Simple AB patterns
+    PATTERNS_AB = [
+        (['🔴', '🔵', '🔴', '🔵', '🔴'], '🔵', ['🔴', '🔵', '🟢']),
+        (['🌙', '⭐', '🌙', '⭐', '🌙'], '⭐', ['🌙', '⭐', '🌟']),
+        (['🐱', '🐶', '🐱', '🐶', '🐱'], '🐶', ['🐱', '🐶', '🐰']),
+        (['▲', '■', '▲', '■', '▲'], '■', ['▲', '■', '●']),
+        (['1', '2', '1', '2', '1'], '2', ['1', '2', '3']),
+    ]
+
+    # AAB patterns
+    PATTERNS_AAB = [
+        (['🔴', '🔴', '🔵', '🔴', '🔴', '🔵', '🔴', '🔴'], '🔵', ['🔴', '🔵', '🟢']),
+        (['👏', '👏', '🙌', '👏', '👏', '🙌', '👏', '👏'], '🙌', ['👏', '🙌', '✋']),
+        (['🍎', '🍎', '🍊', '🍎', '🍎', '🍊', '🍎', '🍎'], '🍊', ['🍎', '🍊', '🍌']),
+    ]
+
+    # ABC patterns
+    PATTERNS_ABC = [
+        (['🔴', '🔵', '🟢', '🔴', '🔵', '🟢', '🔴', '🔵'], '🟢', ['🔴', '🔵', '🟢']),
+        (['🍎', '🍊', '🍌', '🍎', '🍊', '🍌', '🍎', '🍊'], '🍌', ['🍎', '🍊', '🍌']),
+        (['A', 'B', 'C', 'A', 'B', 'C', 'A', 'B'], 'C', ['A', 'B', 'C']),
+    ]
+
+    # Growing number patterns
+    GROWING = [
+        ([1, 2, 3, 4], 5, [5, 6, 4]),
+        ([2, 4, 6, 8], 10, [10, 9, 12]),
+        ([5, 10, 15, 20], 25, [25, 22, 30]),
+        ([1, 3, 5, 7], 9, [9, 8, 11]),
+    ]
+
+    # Shrinking patterns
+    SHRINKING = [
+        ([10, 9, 8, 7], 6, [6, 5, 8]),
+        ([20, 18, 16, 14], 12, [12, 10, 13]),
+        ([15, 12, 9, 6], 3, [3, 4, 0]),
+    ]
 
+    CASES = (
+        ('_pattern_ab', len(PATTERNS_AB), 1),
+        ('_pattern_aab', len(PATTERNS_AAB), 1),
+        ('_pattern_abc', len(PATTERNS_ABC), 1),
+        ('_growing', len(GROWING), 1),
+        ('_shrinking', len(SHRINKING), 1),
+        ('_missing_number', 9 * 9, 1),
+        ('_equality', 28, 1),  # a in 2..8, 1 <= b < a
+    )
+
+    def _pattern_ab(self, i, mix):
+        return self._pattern(self.PATTERNS_AB[i], 'q-lg', mix)
+
+    def _pattern_aab(self, i, mix):
+        return self._pattern(self.PATTERNS_AAB[i], 'q-md', mix)
+
+    def _pattern_abc(self, i, mix):
+        return self._pattern(self.PATTERNS_ABC[i], 'q-md', mix)
+
+    def _pattern(self, pattern, size, mix):
+        pat, correct, opts = pattern
+        display = " ".join(pat) + " <b>?</b>"
+        question = _("What comes next in the pattern?") + f"<br><div class='{size}'>{display}</div>"
+        return self._question(question, correct, opts, mix)
+
+    def _growing(self, i, mix):
+        seq, correct, opts = self.GROWING[i]
+        display = ", ".join(str(n) for n in seq) + ", <b>?</b>"
+        question = _("What number comes next?") + f"<br><div class='q-lg'>{display}</div>"
+        return self._question(question, str(correct), [str(o) for o in opts], mix)
+
+    def _shrinking(self, i, mix):
+        seq, correct, opts = self.SHRINKING[i]
+        display = ", ".join(str(n) for n in seq) + ", <b>?</b>"
+        question = _("The numbers are getting smaller. What comes next?") + f"<br><div class='q-lg'>{display}</div>"
+        return self._question(question, str(correct), [str(o) for o in opts], mix)
+
+    def _missing_number(self, i, mix):
+        # Find the missing number in addition
+        a, b = 1 + i % 9, 1 + i // 9
+        total = a + b
+        question = _("Find the missing number:") + f"<br><div class='q-xl'>{a} + <b>?</b> = {total}</div>"
+        options = [str(b), str(b + 1), str(b - 1) if b > 1 else str(b + 2)]
+        return self._question(question, str(b), options, mix)
+
+    def _equality(self, i, mix):
+        # Balance/equality
+        a, b = _pair_below(i, 1)
+        a += 1
+        c = a - b
+        question = _("Make both sides equal:") + f"<br><div class='q-lg'>{a} = {b} + <b>?</b></div>"
+        options = [str(c), str(c + 1), str(c - 1) if c > 1 else str(c + 2)]
+        return self._question(question, str(c), options, mix)
+
+    def _question(self, question, answer, options, mix):
         return {
             "type": "algebra",
             "strand": _("Patterns"),
             "q": question,
             "a": answer,
-            "options": options
+            "options": _ordered(options, mix)
         }
 
 
-class SpatialQuestions:
+@register_strand('spatial')
+class SpatialQuestions(QuestionSpace):
     """Grade 1 Spatial Sense: 2D shapes, 3D shapes, position, symmetry"""
 
-    # SVG shapes with distinct proportions
+    # Shapes with distinct proportions: symbol in static/shapes.svg, width, height
     SHAPES_2D = {
-        'Triangle': '<svg width="50" height="45" viewBox="0 0 50 45"><polygon points="25,2 48,43 2,43" fill="#e74c3c"/></svg>',
-        'Circle': '<svg width="50" height="50" viewBox="0 0 50 50"><circle cx="25" cy="25" r="22" fill="#3498db"/></svg>',
-        'Square': '<svg width="50" height="50" viewBox="0 0 50 50"><rect x="3" y="3" width="44" height="44" fill="#2ecc71"/></svg>',
-        'Rectangle': '<svg width="70" height="40" viewBox="0 0 70 40"><rect x="2" y="2" width="66" height="36" fill="#9b59b6"/></svg>',
+        N_('Triangle'): ('triangle', 50, 45),
+        N_('Circle'): ('circle', 50, 50),
+        N_('Square'): ('square', 50, 50),
+        N_('Rectangle'): ('rectangle', 70, 40),
     }
 
     SHAPES_3D = {
-        'Sphere': '<svg width="60" height="60" viewBox="0 0 60 60"><defs><radialGradient id="sg" cx="30%" cy="30%"><stop offset="0%" style="stop-color:#5dade2"/><stop offset="100%" style="stop-color:#2874a6"/></radialGradient></defs><circle cx="30" cy="30" r="26" fill="url(#sg)"/></svg>',
-        'Cube': '<svg width="60" height="60" viewBox="0 0 60 60"><polygon points="10,20 30,10 50,20 50,45 30,55 10,45" fill="#58d68d" stroke="#27ae60" stroke-width="2"/><polygon points="10,20 30,30 30,55 10,45" fill="#2ecc71"/><polygon points="30,30 50,20 50,45 30,55" fill="#1d8348"/><line x1="30" y1="10" x2="30" y2="30" stroke="#27ae60" stroke-width="2"/></svg>',
-        'Cylinder': '<svg width="50" height="65" viewBox="0 0 50 65"><ellipse cx="25" cy="12" rx="20" ry="10" fill="#af7ac5"/><rect x="5" y="12" width="40" height="40" fill="#9b59b6"/><ellipse cx="25" cy="52" rx="20" ry="10" fill="#7d3c98"/><ellipse cx="25" cy="12" rx="20" ry="10" fill="#d7bde2"/></svg>',
-        'Cone': '<svg width="50" height="60" viewBox="0 0 50 60"><polygon points="25,5 45,50 5,50" fill="#f5b041"/><ellipse cx="25" cy="50" rx="20" ry="8" fill="#d68910"/></svg>',
+        N_('Sphere'): ('sphere', 60, 60),
+        N_('Cube'): ('cube', 60, 60),
+        N_('Cylinder'): ('cylinder', 50, 65),
+        N_('Cone'): ('cone', 50, 60),
     }
 
-    def _get_shape_name(self, key):
-        """Get translated shape name"""
-        shape_names = {
-            'Triangle': _('Triangle'),
-            'Circle': _('Circle'),
-            'Square': _('Square'),
-            'Rectangle': _('Rectangle'),
-            'Sphere': _('Sphere'),
-            'Cube': _('Cube'),
-            'Cylinder': _('Cylinder'),
-            'Cone': _('Cone'),
-        }
-        return shape_names.get(key, key)
-
-    def generate(self):
-        mode = random.choice(['identify_2d', 'identify_2d', 'identify_3d', 'position', 'count_sides', 'same_shape'])
-
-        if mode == 'identify_2d':
-            target_key = random.choice(list(self.SHAPES_2D.keys()))
-            target_name = self._get_shape_name(target_key)
-            question = _("Which one is a") + f" <b>{target_name}</b>?"
-            answer = self.SHAPES_2D[target_key]
-            options = list(self.SHAPES_2D.values())
-            random.shuffle(options)
-
-        elif mode == 'identify_3d':
-            target_key = random.choice(list(self.SHAPES_3D.keys()))
-            target_name = self._get_shape_name(target_key)
-            question = _("Which one is a") + f" <b>{target_name}</b>?"
-            answer = self.SHAPES_3D[target_key]
-            options = list(self.SHAPES_3D.values())
-            random.shuffle(options)
-
-        elif mode == 'position':
-            positions = [
-                ('above', '🏠<br>🚗', _('house'), _('car')),
-                ('below', '🌳<br>🐕', _('tree'), _('dog')),
-                ('beside', '🧸 📚', _('teddy bear'), _('book')),
-                ('between', '🍎 🍌 🍊', _('banana'), _('apple and orange')),
-            ]
-            pos_word, visual, target, reference = random.choice(positions)
-            pos_word_translated = {
-                'above': _('above'),
-                'below': _('below'),
-                'beside': _('beside'),
-                'between': _('between'),
-            }[pos_word]
-            question = _("Look at the picture:") + f"<br><div style='font-size:2.5rem;margin:15px 0;'>{visual}</div><br>" + _("What is") + f" <b>{pos_word_translated}</b> " + _("the") + f" {reference}?"
-            answer = target
-            all_items = [_('house'), _('car'), _('tree'), _('dog'), _('teddy bear'), _('book'), _('banana'), _('apple'), _('orange')]
-            wrong = [i for i in all_items if i != target][:2]
-            options = [target] + wrong
-            random.shuffle(options)
-
-        elif mode == 'count_sides':
-            side_shapes = [
-                ('Triangle', 3, self.SHAPES_2D['Triangle']),
-                ('Square', 4, self.SHAPES_2D['Square']),
-                ('Rectangle', 4, self.SHAPES_2D['Rectangle']),
-            ]
-            name, sides, svg = random.choice(side_shapes)
-            question = _("How many sides does this shape have?") + f"<br><div style='margin:15px 0;'>{svg}</div>"
-            answer = str(sides)
-            options = ['3', '4', '5']
-            if answer not in options:
-                options[2] = answer
-            random.shuffle(options)
-
-        else:  # same_shape
-            shape_pairs = [
-                ('Triangle', '<svg width="40" height="35"><polygon points="20,2 38,33 2,33" fill="#e74c3c"/></svg>', '<svg width="50" height="45"><polygon points="25,2 48,43 2,43" fill="#c0392b"/></svg>'),
-                ('Circle', '<svg width="35" height="35"><circle cx="17" cy="17" r="15" fill="#3498db"/></svg>', '<svg width="50" height="50"><circle cx="25" cy="25" r="22" fill="#2980b9"/></svg>'),
-                ('Square', '<svg width="35" height="35"><rect x="2" y="2" width="31" height="31" fill="#2ecc71"/></svg>', '<svg width="50" height="50"><rect x="2" y="2" width="46" height="46" fill="#27ae60"/></svg>'),
-            ]
-            name, small, big = random.choice(shape_pairs)
-            translated_name = self._get_shape_name(name)
-            question = _("These shapes are both the same type. What shape are they?") + f"<br><div style='margin:15px 0;display:flex;justify-content:center;gap:20px;align-items:center;'>{small}{big}</div>"
-            answer = translated_name
-            options = [self._get_shape_name('Triangle'), self._get_shape_name('Circle'), self._get_shape_name('Square'), self._get_shape_name('Rectangle')]
-            options = [o for o in options if o != translated_name][:2] + [translated_name]
-            random.shuffle(options)
+    POSITIONS = [
+        (N_('above'), '🏠<br>🚗', N_('house'), N_('car')),
+        (N_('below'), '🌳<br>🐕', N_('tree'), N_('dog')),
+        (N_('beside'), '🧸 📚', N_('teddy bear'), N_('book')),
+        (N_('between'), '🍎 🍌 🍊', N_('banana'), N_('apple and orange')),
+    ]
 
+    POSITION_ITEMS = [N_('house'), N_('car'), N_('tree'), N_('dog'), N_('teddy bear'), N_('book'), N_('banana'), N_('apple'), N_('orange')]
+
+    SIDE_SHAPES = [
+        ('Triangle', 3),
+        ('Square', 4),
+        ('Rectangle', 4),
+    ]
+
+    SHAPE_PAIRS = [
+        ('Triangle', ('triangle-small', 40, 35), ('triangle-big', 50, 45)),
+        ('Circle', ('circle-small', 35, 35), ('circle-big', 50, 50)),
+        ('Square', ('square-small', 35, 35), ('square-big', 50, 50)),
+    ]
+
+    CASES = (
+        ('_identify_2d', len(SHAPES_2D), 2),
+        ('_identify_3d', len(SHAPES_3D), 1),
+        ('_position', len(POSITIONS), 1),
+        ('_count_sides', len(SIDE_SHAPES), 1),
+        ('_same_shape', len(SHAPE_PAIRS), 1),
+    )
+
+    def _get_shape_name(self, key):
+        """Get translated shape name (the SHAPES_* keys are the msgids)"""
+        return _(key)
+
+    def _identify_2d(self, i, mix):
+        return self._identify(self.SHAPES_2D, i, mix)
+
+    def _identify_3d(self, i, mix):
+        return self._identify(self.SHAPES_3D, i, mix)
+
+    def _identify(self, shapes, i, mix):
+        target_key = list(shapes)[i]
+        target_name = self._get_shape_name(target_key)
+        question = _("Which one is a") + f" <b>{target_name}</b>?"
+        return self._question(question, _shape(shapes[target_key]), [_shape(spec) for spec in shapes.values()], mix)
+
+    def _position(self, i, mix):
+        pos_word, visual, target_key, reference_key = self.POSITIONS[i]
+        question = _("Look at the picture:") + f"<br><div class='q-xl'>{visual}</div><br>" + _("What is") + f" <b>{_(pos_word)}</b> " + _("the") + f" {_(reference_key)}?"
+        answer = _(target_key)
+        wrong = [item for item in self.POSITION_ITEMS if item != target_key][:2]
+        return self._question(question, answer, [answer] + [_(item) for item in wrong], mix)
+
+    def _count_sides(self, i, mix):
+        name, sides = self.SIDE_SHAPES[i]
+        question = _("How many sides does this shape have?") + f"<br><div class='q-visual'>{_shape(self.SHAPES_2D[name])}</div>"
+        return self._question(question, str(sides), ['3', '4', '5'], mix)
+
+    def _same_shape(self, i, mix):
+        name, small, big = self.SHAPE_PAIRS[i]
+        translated_name = self._get_shape_name(name)
+        question = _("These shapes are both the same type. What shape are they?") + f"<br><div class='q-visual shape-pair'>{_shape(small)}{_shape(big)}</div>"
+        wrong = [key for key in self.SHAPES_2D if key != name][:2]
+        options = [self._get_shape_name(key) for key in wrong] + [translated_name]
+        return self._question(question, translated_name, options, mix)
+
+    def _question(self, question, answer, options, mix):
         return {
             "type": "spatial",
             "strand": _("Spatial"),
             "q": question,
             "a": answer,
-            "options": options
+            "options": _ordered(options, mix)
         }
 
 
-class PlaceValueQuestions:
+@register_strand('placevalue')
+class PlaceValueQuestions(QuestionSpace):
     """Grade 1 Place Value: Understanding tens and ones (numbers to 50)"""
 
-    def generate(self):
-        mode = random.choice(['identify_tens', 'identify_ones', 'compose', 'decompose'])
-
-        if mode == 'identify_tens':
-            num = random.randint(10, 50)
-            tens = num // 10
-            ones = num % 10
-            # Visual: Base-10 blocks (brown squares for tens, yellow for ones)
-            blocks_visual = "🟫 " * tens + "🟨 " * ones if ones > 0 else "🟫 " * tens
-            question = _("How many tens are in the number") + f" {num}?<br><div style='font-size:1.5rem;margin:10px 0'>{blocks_visual.strip()}</div>"
-            answer = str(tens)
-            options = [str(tens), str(tens + 1) if tens < 5 else str(tens - 1), str(ones)]
-
-        elif mode == 'identify_ones':
-            num = random.randint(10, 50)
-            tens = num // 10
-            ones = num % 10
-            blocks_visual = "🟫 " * tens + "🟨 " * ones if ones > 0 else "🟫 " * tens
-            question = _("How many ones are in the number") + f" {num}?<br><div style='font-size:1.5rem;margin:10px 0'>{blocks_visual.strip()}</div>"
-            answer = str(ones)
-            options = [str(ones), str(tens), str((ones + 2) % 10)]
-
-        elif mode == 'compose':
-            tens = random.randint(1, 4)
-            ones = random.randint(0, 9)
-            correct = tens * 10 + ones
-            tens_word = _("tens")
-            ones_word = _("ones")
-            question = f"<b>{tens} {tens_word}</b> " + _("and") + f" <b>{ones} {ones_word}</b> = ?"
-            answer = str(correct)
-            options = [str(correct), str(correct + 10), str(correct + 1) if ones < 9 else str(correct - 1)]
-
-        else:  # decompose
-            num = random.randint(11, 49)
-            tens = num // 10
-            ones = num % 10
-            question = _("Break apart") + f" <b>{num}</b> " + _("into tens and ones:")
-            tens_word = _("tens")
-            ones_word = _("ones")
-            answer = f"{tens} {tens_word}, {ones} {ones_word}"
-            options = [
-                f"{tens} {tens_word}, {ones} {ones_word}",
-                f"{tens + 1} {tens_word}, {ones} {ones_word}",
-                f"{tens} {tens_word}, {ones + 1 if ones < 9 else ones - 1} {ones_word}"
-            ]
-
-        # Deduplicate options
-        seen = set()
-        unique = []
-        for opt in options:
-            if opt not in seen:
-                seen.add(opt)
-                unique.append(opt)
-        if answer not in unique:
-            unique.append(answer)
-        random.shuffle(unique)
+    CASES = (
+        ('_identify_tens', 41, 1),  # 10..50
+        ('_identify_ones', 41, 1),  # 10..50
+        ('_compose', 4 * 10, 1),    # 1..4 tens, 0..9 ones
+        ('_decompose', 39, 1),      # 11..49
+    )
+
+    @functools.lru_cache(maxsize=None)
+    def _draw_blocks(self, tens, ones):
+        # Visual: Base-10 blocks (brown squares for tens, yellow for ones)
+        blocks_visual = "🟫 " * tens + "🟨 " * ones if ones > 0 else "🟫 " * tens
+        return f"<div class='q-sm'>{blocks_visual.strip()}</div>"
+
+    def _blocks(self, tens, ones):
+        return _fragment('blocks', self._draw_blocks, tens, ones)
+
+    def _identify_tens(self, i, mix):
+        num = 10 + i
+        tens = num // 10
+        ones = num % 10
+        question = _("How many tens are in the number") + f" {num}?<br>{self._blocks(tens, ones)}"
+        options = [str(tens), str(tens + 1) if tens < 5 else str(tens - 1), str(ones)]
+        return self._question(question, str(tens), options, mix)
+
+    def _identify_ones(self, i, mix):
+        num = 10 + i
+        tens = num // 10
+        ones = num % 10
+        question = _("How many ones are in the number") + f" {num}?<br>{self._blocks(tens, ones)}"
+        options = [str(ones), str(tens), str((ones + 2) % 10)]
+        return self._question(question, str(ones), options, mix)
+
+    def _compose(self, i, mix):
+        tens = 1 + i // 10
+        ones = i % 10
+        correct = tens * 10 + ones
+        tens_word = _("tens")
+        ones_word = _("ones")
+        question = f"<b>{tens} {tens_word}</b> " + _("and") + f" <b>{ones} {ones_word}</b> = ?"
+        options = [str(correct), str(correct + 10), str(correct + 1) if ones < 9 else str(correct - 1)]
+        return self._question(question, str(correct), options, mix)
+
+    def _decompose(self, i, mix):
+        num = 11 + i
+        tens = num // 10
+        ones = num % 10
+        question = _("Break apart") + f" <b>{num}</b> " + _("into tens and ones:")
+        tens_word = _("tens")
+        ones_word = _("ones")
+        answer = f"{tens} {tens_word}, {ones} {ones_word}"
+        options = [
+            f"{tens} {tens_word}, {ones} {ones_word}",
+            f"{tens + 1} {tens_word}, {ones} {ones_word}",
+            f"{tens} {tens_word}, {ones + 1 if ones < 9 else ones - 1} {ones_word}"
+        ]
+        return self._question(question, answer, options, mix)
 
+    def _question(self, question, answer, options, mix):
         return {
             "type": "placevalue",
             "strand": _("Place Value"),
             "q": question,
             "a": answer,
-            "options": unique
+            "options": _ordered(_unique(options, answer), mix)
         }
 
 
-class TimeTellingQuestions:
+@register_strand('time')
+class TimeTellingQuestions(QuestionSpace):
     """Grade 1 Time: Reading o'clock and half-past on analog clocks"""
 
+    ACTIVITIES = [
+        (N_("wake up for school"), "7:00"),
+        (N_("eat lunch"), "12:00"),
+        (N_("eat dinner"), "6:00"),
+        (N_("go to bed"), "8:00"),
+    ]
+
+    CASES = (
+        ('_read_oclock', 12, 1),
+        ('_read_half', 12, 1),
+        ('_activity', len(ACTIVITIES), 1),
+    )
+
+    @functools.lru_cache(maxsize=None)
     def _draw_clock(self, hour, minutes):
-        """Generate an SVG analog clock face."""
+        """Generate an SVG analog clock face (24 distinct, rendered once each)."""
         # Hour hand angle (30 degrees per hour + 0.5 per minute)
         hour_angle = (hour % 12) * 30 + minutes * 0.5
         # Minute hand angle (6 degrees per minute)
         min_angle = minutes * 6
 
         return f'''
-        <svg class="clock" width="140" height="140" viewBox="0 0 100 100" style="display:block;margin:15px auto;">
+        <svg class="clock" width="140" height="140" viewBox="0 0 100 100">
             <circle cx="50" cy="50" r="45" fill="white" stroke="#333" stroke-width="3"/>
             <text x="50" y="18" text-anchor="middle" font-size="12" font-weight="bold">12</text>
             <text x="82" y="54" text-anchor="middle" font-size="12" font-weight="bold">3</text>
@@ -412,289 +670,307 @@ class TimeTellingQuestions:
         </svg>
         '''
 
-    def generate(self):
-        mode = random.choice(['read_oclock', 'read_half', 'activity'])
-
-        if mode == 'read_oclock':
-            hour = random.randint(1, 12)
-            clock_html = self._draw_clock(hour, 0)
-            question = _("What time does the clock show?") + clock_html
-            answer = f"{hour}:00"
-            other_hour = (hour % 12) + 1
-            options = [f"{hour}:00", f"{other_hour}:00", f"{hour}:30"]
-
-        elif mode == 'read_half':
-            hour = random.randint(1, 12)
-            clock_html = self._draw_clock(hour, 30)
-            question = _("What time does the clock show?") + clock_html
-            answer = f"{hour}:30"
-            other_hour = (hour % 12) + 1
-            options = [f"{hour}:30", f"{hour}:00", f"{other_hour}:00"]
-
-        else:  # activity matching
-            activities = [
-                (_("wake up for school"), "7:00"),
-                (_("eat lunch"), "12:00"),
-                (_("eat dinner"), "6:00"),
-                (_("go to bed"), "8:00"),
-            ]
-            activity, time = random.choice(activities)
-            question = _("What time do most kids") + f" <b>{activity}</b>?"
-            answer = time
-            all_times = ["7:00", "12:00", "6:00", "8:00", "3:00"]
-            options = [t for t in all_times if t != time][:2] + [time]
-
-        random.shuffle(options)
+    def _read_oclock(self, i, mix):
+        hour = 1 + i
+        question = _("What time does the clock show?") + _fragment('clock', self._draw_clock, hour, 0)
+        other_hour = (hour % 12) + 1
+        options = [f"{hour}:00", f"{other_hour}:00", f"{hour}:30"]
+        return self._question(question, f"{hour}:00", options, mix)
+
+    def _read_half(self, i, mix):
+        hour = 1 + i
+        question = _("What time does the clock show?") + _fragment('clock', self._draw_clock, hour, 30)
+        other_hour = (hour % 12) + 1
+        options = [f"{hour}:30", f"{hour}:00", f"{other_hour}:00"]
+        return self._question(question, f"{hour}:30", options, mix)
+
+    def _activity(self, i, mix):
+        # Activity matching
+        activity, time = self.ACTIVITIES[i]
+        question = _("What time do most kids") + f" <b>{_(activity)}</b>?"
+        all_times = ["7:00", "12:00", "6:00", "8:00", "3:00"]
+        options = [t for t in all_times if t != time][:2] + [time]
+        return self._question(question, time, options, mix)
+
+    def _question(self, question, answer, options, mix):
         return {
             "type": "time",
             "strand": _("Time"),
             "q": question,
             "a": answer,
-            "options": options
+            "options": _ordered(options, mix)
         }
 
 
-class MeasurementQuestions:
+@register_strand('measurement')
+class MeasurementQuestions(QuestionSpace):
     """Grade 1 Measurement: Comparing lengths and using non-standard units"""
 
-    def generate(self):
-        mode = random.choice(['compare', 'count_units', 'order'])
-
-        if mode == 'compare':
-            items = [
-                (_("pencil"), 5, "✏️"),
-                (_("crayon"), 3, "🖍️"),
-                (_("marker"), 6, "🖊️"),
-                (_("eraser"), 2, "🧽"),
-                (_("book"), 8, "📕"),
-            ]
-            item1 = random.choice(items)
-            item2 = random.choice([i for i in items if i[0] != item1[0]])
-
-            bar1 = "█" * item1[1]
-            bar2 = "█" * item2[1]
-
-            question = _("Which is longer?") + f'''<br>
-            <div style="text-align:left;margin:15px;font-family:monospace;">
-                <div>{item1[2]} {item1[0].title()}: <span style="color:#3498db">{bar1}</span></div>
-                <div>{item2[2]} {item2[0].title()}: <span style="color:#e74c3c">{bar2}</span></div>
-            </div>'''
-
-            if item1[1] > item2[1]:
-                answer = item1[0].title()
-            else:
-                answer = item2[0].title()
-            options = [item1[0].title(), item2[0].title(), _("They are the same")]
-
-        elif mode == 'count_units':
-            units = random.randint(3, 7)
-            unit_emoji = random.choice(["📎", "🧱", "📏"])
-            line = "━" * (units * 2)
-
-            question = _("How many") + f" {unit_emoji} " + _("long is this line?") + f'''<br>
-            <div style="margin:15px 0;font-size:1.5rem;">{line}</div>
-            <div style="font-size:1.3rem;">{unit_emoji * units}</div>'''
-
-            answer = str(units)
-            options = [str(units), str(units + 1), str(units - 1)]
-
-        else:  # order by size
-            question = _("Put these in order from shortest to longest:") + "<br><br>🐜 " + _("Ant") + ", 🐱 " + _("Cat") + ", 🐘 " + _("Elephant")
-            answer = _("Ant") + ", " + _("Cat") + ", " + _("Elephant")
-            options = [
-                _("Ant") + ", " + _("Cat") + ", " + _("Elephant"),
-                _("Elephant") + ", " + _("Cat") + ", " + _("Ant"),
-                _("Cat") + ", " + _("Ant") + ", " + _("Elephant")
-            ]
-
-        random.shuffle(options)
+    ITEMS = [
+        (N_("pencil"), 5, "✏️"),
+        (N_("crayon"), 3, "🖍️"),
+        (N_("marker"), 6, "🖊️"),
+        (N_("eraser"), 2, "🧽"),
+        (N_("book"), 8, "📕"),
+    ]
+
+    UNIT_EMOJIS = ["📎", "🧱", "📏"]
+
+    CASES = (
+        ('_compare', len(ITEMS) * (len(ITEMS) - 1), 1),  # ordered pairs of different items
+        ('_count_units', 5 * len(UNIT_EMOJIS), 1),  # 3..7 units
+        ('_order', 1, 1),
+    )
+
+    def _compare(self, i, mix):
+        name1, length1, emoji1 = self.ITEMS[i % 5]
+        name2, length2, emoji2 = self.ITEMS[(i % 5 + 1 + i // 5) % 5]
+        name1, name2 = _(name1).title(), _(name2).title()
+
+        bar1 = "█" * length1
+        bar2 = "█" * length2
+
+        question = _("Which is longer?") + (
+            "<br><div class='bars'>"
+            f"<div>{emoji1} {name1}: <span class='bar-a'>{bar1}</span></div>"
+            f"<div>{emoji2} {name2}: <span class='bar-b'>{bar2}</span></div>"
+            "</div>"
+        )
+
+        answer = name1 if length1 > length2 else name2
+        options = [name1, name2, _("They are the same")]
+        return self._question(question, answer, options, mix)
+
+    def _count_units(self, i, mix):
+        units = 3 + i % 5
+        unit_emoji = self.UNIT_EMOJIS[i // 5]
+        line = "━" * (units * 2)
+
+        question = _("How many") + f" {unit_emoji} " + _("long is this line?") + (
+            f"<br><div class='q-sm'>{line}</div><div class='q-units'>{unit_emoji * units}</div>"
+        )
+
+        options = [str(units), str(units + 1), str(units - 1)]
+        return self._question(question, str(units), options, mix)
+
+    def _order(self, i, mix):
+        # Order by size
+        ant, cat, elephant = _("Ant"), _("Cat"), _("Elephant")
+        question = _("Put these in order from shortest to longest:") + f"<br><br>🐜 {ant}, 🐱 {cat}, 🐘 {elephant}"
+        answer = f"{ant}, {cat}, {elephant}"
+        options = [
+            f"{ant}, {cat}, {elephant}",
+            f"{elephant}, {cat}, {ant}",
+            f"{cat}, {ant}, {elephant}"
+        ]
+        return self._question(question, answer, options, mix)
+
+    def _question(self, question, answer, options, mix):
         return {
             "type": "measurement",
             "strand": _("Measurement"),
             "q": question,
             "a": answer,
-            "options": options
+            "options": _ordered(options, mix)
         }
 
 
-class WordProblemQuestions:
+@register_strand('wordproblems')
+class WordProblemQuestions(QuestionSpace):
     """Grade 1 Word Problems: Story-based addition and subtraction"""
 
-    def generate(self):
-        mode = random.choice(['addition', 'subtraction'])
-
-        if mode == 'addition':
-            templates = [
-                (_("Sara has {a} apples. Mom gives her {b} more. How many apples does Sara have now?"), "🍎"),
-                (_("There are {a} birds in a tree. {b} more birds fly in. How many birds are there now?"), "🐦"),
-                (_("Tom has {a} cookies. He bakes {b} more. How many cookies does he have?"), "🍪"),
-                (_("You have {a} stickers. Your friend gives you {b} more. How many stickers do you have?"), "⭐"),
-            ]
-            template, emoji = random.choice(templates)
-            a = random.randint(2, 8)
-            b = random.randint(1, 5)
-            answer = a + b
-
-            question = template.format(a=a, b=b)
-            visual = f"<div style='font-size:1.5rem;margin:10px 0'>{emoji * a} + {emoji * b}</div>"
-            question = f"{question}{visual}"
-
-        else:  # subtraction
-            templates = [
-                (_("You have {a} balloons. {b} pop! How many balloons are left?"), "🎈"),
-                (_("There are {a} cookies. You eat {b}. How many cookies are left?"), "🍪"),
-                (_("{a} frogs are on a log. {b} jump away. How many frogs are still on the log?"), "🐸"),
-                (_("Mom baked {a} cupcakes. You ate {b}. How many are left?"), "🧁"),
-            ]
-            template, emoji = random.choice(templates)
-            a = random.randint(5, 10)
-            b = random.randint(1, a - 1)
-            answer = a - b
-
-            question = template.format(a=a, b=b)
+    ADDITION_TEMPLATES = [
+        (N_("Sara has {a} apples. Mom gives her {b} more. How many apples does Sara have now?"), "🍎"),
+        (N_("There are {a} birds in a tree. {b} more birds fly in. How many birds are there now?"), "🐦"),
+        (N_("Tom has {a} cookies. He bakes {b} more. How many cookies does he have?"), "🍪"),
+        (N_("You have {a} stickers. Your friend gives you {b} more. How many stickers do you have?"), "⭐"),
+    ]
 
-        options = [str(answer), str(answer + 1), str(answer - 1) if answer > 1 else str(answer + 2)]
-        random.shuffle(options)
+    SUBTRACTION_TEMPLATES = [
+        (N_("You have {a} balloons. {b} pop! How many balloons are left?"), "🎈"),
+        (N_("There are {a} cookies. You eat {b}. How many cookies are left?"), "🍪"),
+        (N_("{a} frogs are on a log. {b} jump away. How many frogs are still on the log?"), "🐸"),
+        (N_("Mom baked {a} cupcakes. You ate {b}. How many are left?"), "🧁"),
+    ]
 
+    CASES = (
+        ('_addition', 4 * 7 * 5, 1),  # template, a in 2..8, b in 1..5
+        ('_subtraction', 4 * 39, 1),  # template, a in 5..10, 1 <= b < a
+    )
+
+    def _addition(self, i, mix):
+        template, emoji = self.ADDITION_TEMPLATES[i % 4]
+        a = 2 + i // 4 % 7
+        b = 1 + i // 28
+        question = _(template).format(a=a, b=b)
+        visual = f"<div class='q-sm'>{emoji * a} + {emoji * b}</div>"
+        return self._question(f"{question}{visual}", a + b, mix)
+
+    def _subtraction(self, i, mix):
+        template, _emoji = self.SUBTRACTION_TEMPLATES[i % 4]
+        a, b = _pair_below(i // 4, 4)
+        a += 1
+        return self._question(_(template).format(a=a, b=b), a - b, mix)
+
+    def _question(self, question, answer, mix):
+        options = [str(answer), str(answer + 1), str(answer - 1) if answer > 1 else str(answer + 2)]
         return {
             "type": "wordproblems",
             "strand": _("Word Problems"),
             "q": question,
             "a": str(answer),
-            "options": options
+            "options": _ordered(options, mix)
         }
 
 
-class ComparingQuestions:
+@register_strand('comparing')
+class ComparingQuestions(QuestionSpace):
     """Grade 1 Comparing Numbers: Greater than, less than, equal"""
 
-    def generate(self):
-        mode = random.choice(['greater_less', 'fill_symbol', 'number_line'])
+    CASES = (
+        ('_greater_less', 50 * 49, 1),  # two different numbers in 1..50
+        ('_fill_symbol', 30 * 30, 1),
+        ('_number_line', 11 * 3 * 2, 1),  # target in 5..15, answer offset, wrong offset
+    )
 
-        if mode == 'greater_less':
-            a = random.randint(1, 50)
-            b = random.randint(1, 50)
-            while a == b:
-                b = random.randint(1, 50)
+    def _greater_less(self, i, mix):
+        a = 1 + i % 50
+        b = 1 + (i % 50 + 1 + i // 50) % 50
 
-            question = _("Which number is greater?") + f"<br><div style='font-size:2.5rem;margin:15px 0;'>{a} &nbsp;&nbsp; " + _("or") + f" &nbsp;&nbsp; {b}</div>"
-            answer = str(max(a, b))
-            options = [str(a), str(b), _("They are equal")]
+        question = _("Which number is greater?") + f"<br><div class='q-xl'>{a} &nbsp;&nbsp; " + _("or") + f" &nbsp;&nbsp; {b}</div>"
+        options = [str(a), str(b), _("They are equal")]
+        return self._question(question, str(max(a, b)), options, mix)
 
-        elif mode == 'fill_symbol':
-            a = random.randint(1, 30)
-            b = random.randint(1, 30)
+    def _fill_symbol(self, i, mix):
+        a = 1 + i % 30
+        b = 1 + i // 30
 
-            question = _("Fill in the blank:") + f"<br><div style='font-size:2.5rem;margin:15px 0;'>{a} &nbsp; ⬜ &nbsp; {b}</div><p>" + _("Choose the correct symbol:") + "</p>"
+        question = _("Fill in the blank:") + f"<br><div class='q-xl'>{a} &nbsp; ⬜ &nbsp; {b}</div><p>" + _("Choose the correct symbol:") + "</p>"
 
-            if a > b:
-                answer = ">"
-            elif a < b:
-                answer = "<"
-            else:
-                answer = "="
-            options = [">", "<", "="]
-
-        else:  # number_line
-            target = random.randint(5, 15)
-            question = _("Look at the number line. Which number is greater than") + f" {target}?<br>"
-            question += f'''<div style="margin:15px 0;font-family:monospace;">
-                ◀─ {target-3} ─ {target-2} ─ {target-1} ─ <b>{target}</b> ─ {target+1} ─ {target+2} ─ {target+3} ─▶
-            </div>'''
-            answer = str(target + random.randint(1, 3))
-            wrong1 = str(target - random.randint(1, 2))
-            wrong2 = str(target)
-            options = [answer, wrong1, wrong2]
-
-        random.shuffle(options)
+        if a > b:
+            answer = ">"
+        elif a < b:
+            answer = "<"
+        else:
+            answer = "="
+        return self._question(question, answer, [">", "<", "="], mix)
+
+    def _number_line(self, i, mix):
+        target = 5 + i % 11
+        question = _("Look at the number line. Which number is greater than") + f" {target}?<br>"
+        question += (
+            f"<div class='number-line'>◀─ {target-3} ─ {target-2} ─ {target-1} ─ <b>{target}</b>"
+            f" ─ {target+1} ─ {target+2} ─ {target+3} ─▶</div>"
+        )
+        answer = str(target + 1 + i // 11 % 3)
+        wrong1 = str(target - 1 - i // 33)
+        wrong2 = str(target)
+        return self._question(question, answer, [answer, wrong1, wrong2], mix)
+
+    def _question(self, question, answer, options, mix):
         return {
             "type": "comparing",
             "strand": _("Comparing"),
             "q": question,
             "a": answer,
-            "options": options
+            "options": _ordered(options, mix)
         }
 
 
-class SkipCountingQuestions:
+@register_strand('skipcounting')
+class SkipCountingQuestions(QuestionSpace):
     """Grade 1 Skip Counting: Counting by 2s, 5s, and 10s"""
 
-    def generate(self):
-        skip = random.choice([2, 5, 10])
-        mode = random.choice(['next_number', 'fill_gap', 'count_objects'])
-
-        if mode == 'next_number':
-            start = random.randint(0, 3) * skip
-            sequence = [start + skip * i for i in range(4)]
-            display = ", ".join(str(n) for n in sequence) + ", ?"
-
-            question = _("Count by") + f" <b>{skip}s</b>. " + _("What comes next?") + f"<br><div style='font-size:1.8rem;margin:15px 0;'>{display}</div>"
-            answer = str(sequence[-1] + skip)
-            options = [
-                str(sequence[-1] + skip),
-                str(sequence[-1] + 1),
-                str(sequence[-1] + skip + skip)
-            ]
-
-        elif mode == 'fill_gap':
-            start = random.randint(0, 2) * skip
-            sequence = [start + skip * i for i in range(5)]
-            gap_idx = random.randint(1, 3)
-            missing = sequence[gap_idx]
-            display_seq = [str(n) if i != gap_idx else "?" for i, n in enumerate(sequence)]
-            display = ", ".join(display_seq)
-
-            question = _("Count by") + f" <b>{skip}s</b>. " + _("What is the missing number?") + f"<br><div style='font-size:1.8rem;margin:15px 0;'>{display}</div>"
-            answer = str(missing)
-            options = [str(missing), str(missing + 1), str(missing - 1)]
-
-        else:  # count_objects
-            count = random.randint(3, 6)
-            if skip == 2:
-                emoji = "👟"
-                item = _("pairs of shoes")
-            elif skip == 5:
-                emoji = "🖐️"
-                item = _("hands (5 fingers each)")
-            else:  # 10
-                emoji = "🔟"
-                item = _("groups of 10")
-
-            total = count * skip
-            question = _("Count by") + f" <b>{skip}s</b>. " + _("How many in total?") + f"<br><div style='font-size:2rem;margin:15px 0;'>{emoji * count}</div><p>{count} {item}</p>"
-            answer = str(total)
-            options = [str(total), str(total + skip), str(total - skip) if total > skip else str(total + skip * 2)]
-
-        # Deduplicate
-        seen = set()
-        unique = []
-        for opt in options:
-            if opt not in seen:
-                seen.add(opt)
-                unique.append(opt)
-        if answer not in unique:
-            unique.append(answer)
-        random.shuffle(unique)
-
+    SKIPS = [2, 5, 10]
+
+    CASES = (
+        ('_next_number', 3 * 4, 1),      # skip, start
+        ('_fill_gap', 3 * 3 * 3, 1),     # skip, start, gap
+        ('_count_objects', 3 * 4, 1),    # skip, 3..6 groups
+    )
+
+    def _next_number(self, i, mix):
+        skip = self.SKIPS[i % 3]
+        start = i // 3 * skip
+        sequence = [start + skip * n for n in range(4)]
+        display = ", ".join(str(n) for n in sequence) + ", ?"
+
+        question = _("Count by") + f" <b>{skip}s</b>. " + _("What comes next?") + f"<br><div class='q-md'>{display}</div>"
+        answer = str(sequence[-1] + skip)
+        options = [
+            str(sequence[-1] + skip),
+            str(sequence[-1] + 1),
+            str(sequence[-1] + skip + skip)
+        ]
+        return self._question(question, answer, options, mix)
+
+    def _fill_gap(self, i, mix):
+        skip = self.SKIPS[i % 3]
+        start = i // 3 % 3 * skip
+        sequence = [start + skip * n for n in range(5)]
+        gap_idx = 1 + i // 9
+        missing = sequence[gap_idx]
+        display_seq = [str(n) if n_idx != gap_idx else "?" for n_idx, n in enumerate(sequence)]
+        display = ", ".join(display_seq)
+
+        question = _("Count by") + f" <b>{skip}s</b>. " + _("What is the missing number?") + f"<br><div class='q-md'>{display}</div>"
+        options = [str(missing), str(missing + 1), str(missing - 1)]
+        return self._question(question, str(missing), options, mix)
+
+    def _count_objects(self, i, mix):
+        skip = self.SKIPS[i % 3]
+        count = 3 + i // 3
+        if skip == 2:
+            emoji = "👟"
+            item = _("pairs of shoes")
+        elif skip == 5:
+            emoji = "🖐️"
+            item = _("hands (5 fingers each)")
+        else:  # 10
+            emoji = "🔟"
+            item = _("groups of 10")
+
+        total = count * skip
+        question = _("Count by") + f" <b>{skip}s</b>. " + _("How many in total?") + f"<br><div class='q-lg'>{emoji * count}</div><p>{count} {item}</p>"
+        options = [str(total), str(total + skip), str(total - skip) if total > skip else str(total + skip * 2)]
+        return self._question(question, str(total), options, mix)
+
+    def _question(self, question, answer, options, mix):
         return {
             "type": "skipcounting",
             "strand": _("Skip Counting"),
             "q": question,
             "a": answer,
-            "options": unique
+            "options": _ordered(_unique(options, answer), mix)
         }
 
 
-class MoneyCounting:
-    # Define coins as class-level data without translations
+@register_strand('financial')
+class MoneyCounting(QuestionSpace):
+    # Coin names are msgids, translated when used
     COINS_DATA = [
-        {"val": 5,   "css": "nickel",   "name_key": "Nickel"},
-        {"val": 10,  "css": "dime",     "name_key": "Dime"},
-        {"val": 25,  "css": "quarter",  "name_key": "Quarter"},
-        {"val": 100, "css": "loonie",   "name_key": "Loonie", "suffix": " ($1)"},
-        {"val": 200, "css": "toonie",   "name_key": "Toonie", "suffix": " ($2)"}
+        {"val": 5,   "css": "nickel",   "name_key": N_("Nickel")},
+        {"val": 10,  "css": "dime",     "name_key": N_("Dime")},
+        {"val": 25,  "css": "quarter",  "name_key": N_("Quarter")},
+        {"val": 100, "css": "loonie",   "name_key": N_("Loonie"), "suffix": " ($1)"},
+        {"val": 200, "css": "toonie",   "name_key": N_("Toonie"), "suffix": " ($2)"}
     ]
 
+    # The 6 ways to pick two of the other four coins as distractors
+    DISTRACTOR_PAIRS = list(itertools.combinations(range(4), 2))
+
+    # Smart distractors are off by 5, 10, or 25 cents
+    OFFSETS = [-5, 5, -10, 10, -25, 25]
+
+    # 50% Chance: Identify a single coin
+    # 50% Chance: Count a small pile of 2-4 coins
+    CASES = (
+        ('_identify', len(COINS_DATA) * len(DISTRACTOR_PAIRS), 3),
+        ('_count_2', 5 ** 2, 1),
+        ('_count_3', 5 ** 3, 1),
+        ('_count_4', 5 ** 4, 1),
+    )
+
     def _get_coin_name(self, coin_data):
         """Get translated coin name."""
         name = _(coin_data["name_key"])
@@ -702,82 +978,195 @@ class MoneyCounting:
             name += coin_data["suffix"]
         return name
 
-    def generate(self):
-        # 50% Chance: Identify a single coin
-        # 50% Chance: Count a small pile
-        mode = random.choice(['identify', 'count'])
-
-        if mode == 'identify':
-            target = random.choice(self.COINS_DATA)
-            question_html = f"""
-                <div class='coin-container'>
-                    <div class='coin {target['css']}'></div>
-                </div>
-                <br>""" + _("What is this coin?")
-
-            answer = self._get_coin_name(target)
-            # Distractors: Other coin names
-            options = [self._get_coin_name(c) for c in self.COINS_DATA if c['name_key'] != target['name_key']]
-            random.shuffle(options)
-            options = options[:2] + [answer]
-            random.shuffle(options)
-
-            return {
-                "type": "financial",
-                "strand": _("Financial"),
-                "q": question_html,
-                "a": answer,
-                "options": options
-            }
-
-        else: # mode == 'count'
-            # Grade 1 Limit: Keep total under $5 (500 cents) generally
-            # Generate 2-5 coins
-            pile = []
-            for _i in range(random.randint(2, 4)):
-                pile.append(random.choice(self.COINS_DATA))
-
-            total_cents = sum(c['val'] for c in pile)
-
-            # Format the answer ($3.25 or 45¢)
-            if total_cents >= 100:
-                answer_str = f"${total_cents/100:.2f}"
-            else:
-                answer_str = f"{total_cents}¢"
-
-            # Generate the Visual Pile
-            coins_html = ""
-            for c in pile:
-                coins_html += f"<div class='coin {c['css']}'></div>"
-
-            question_html = _("How much money is this?") + f"<br><div class='coin-container'>{coins_html}</div>"
-
-            # Generate Smart Distractors (off by 5, 10, or 25 cents)
-            distractors = set()
-            while len(distractors) < 2:
-                offset = random.choice([-5, 5, -10, 10, -25, 25])
-                fake_val = total_cents + offset
-                if fake_val > 0 and fake_val != total_cents:
-                    if fake_val >= 100:
-                        distractors.add(f"${fake_val/100:.2f}")
-                    else:
-                        distractors.add(f"{fake_val}¢")
-
-            options = list(distractors) + [answer_str]
-            random.shuffle(options)
-
-            return {
-                "type": "financial",
-                "strand": _("Financial"),
-                "q": question_html,
-                "a": answer_str,
-                "options": options
-            }
-
-
-class CodingQuestions:
+    def _identify(self, i, mix):
+        target = self.COINS_DATA[i % 5]
+        question_html = _fragment('coin', self._coin_html, target['css']) + "<br>" + _("What is this coin?")
+
+        answer = self._get_coin_name(target)
+        # Distractors: Other coin names
+        others = [c for c in self.COINS_DATA if c is not target]
+        first, second = self.DISTRACTOR_PAIRS[i // 5]
+        options = [self._get_coin_name(others[first]), self._get_coin_name(others[second]), answer]
+        return self._question(question_html, answer, options, mix)
+
+    def _count(self, i, mix, coins):
+        # Grade 1 Limit: Keep total under $5 (500 cents) generally
+        pile = []
+        for _i in range(coins):
+            i, coin = divmod(i, 5)
+            pile.append(coin)
+
+        total_cents = sum(self.COINS_DATA[coin]['val'] for coin in pile)
+
+        question_html = _("How much money is this?") + "<br>" + _fragment('coins', self._pile_html, *(self.COINS_DATA[coin]['css'] for coin in pile))
+
+        # Two different offsets that keep the amount positive
+        offsets = [o for o in self.OFFSETS if total_cents + o > 0]
+        first = mix % len(offsets)
+        second = (first + 1 + mix // len(offsets) % (len(offsets) - 1)) % len(offsets)
+        distractors = [self._format_cents(total_cents + offsets[first]), self._format_cents(total_cents + offsets[second])]
+
+        answer_str = self._format_cents(total_cents)
+        return self._question(question_html, answer_str, distractors + [answer_str], mix // 36)
+
+    _count_2 = functools.partialmethod(_count, coins=2)
+    _count_3 = functools.partialmethod(_count, coins=3)
+    _count_4 = functools.partialmethod(_count, coins=4)
+
+    @functools.lru_cache(maxsize=None)
+    def _coin_html(self, css):
+        """A single coin, as shown by identify questions."""
+        return f"<div class='coin-container'><div class='coin {css}'></div></div>"
+
+    @functools.lru_cache(maxsize=None)
+    def _pile_html(self, *pile):
+        """The visual pile for a sequence of coin classes (775 distinct)."""
+        coins_html = ""
+        for css in pile:
+            coins_html += f"<div class='coin {css}'></div>"
+        return f"<div class='coin-container'>{coins_html}</div>"
+
+    def _format_cents(self, cents):
+        # Format the amount ($3.25 or 45¢)
+        if cents >= 100:
+            return f"${cents/100:.2f}"
+        return f"{cents}¢"
+
+    def _question(self, question, answer, options, mix):
+        return {
+            "type": "financial",
+            "strand": _("Financial"),
+            "q": question,
+            "a": answer,
+            "options": _ordered(options, mix)
+        }
+
+
+@register_strand('coding')
+class CodingQuestions(QuestionSpace):
     """Grade 1 Coding: Sequential thinking, debugging, conditionals, loops"""
 
+    DEBUG_SCENARIOS = [
+        {
+            "task": N_("The robot wants to go RIGHT then DOWN."),
+            "buggy": "⬇️ ➡️",
+            "correct": "➡️ ⬇️",
+            "bug_explanation": N_("The steps are in the wrong order!")
+        },
+        {
+            "task": N_("The robot wants to go UP twice."),
+            "buggy": "⬆️ ⬇️",
+            "correct": "⬆️ ⬆️",
+            "bug_explanation": N_("The second step goes the wrong way!")
+        },
+        {
+            "task": N_("The robot wants to go LEFT then LEFT again."),
+            "buggy": "⬅️ ➡️",
+            "correct": "⬅️ ⬅️",
+            "bug_explanation": N_("The second step goes the wrong way!")
+        },
+        {
+            "task": N_("The robot wants to go DOWN then RIGHT."),
+            "buggy": "➡️ ⬇️",
+            "correct": "⬇️ ➡️",
+            "bug_explanation": N_("The steps are backwards!")
+        },
+    ]
+
+    CONDITIONAL_SCENARIOS = [
+        {
+            "condition": N_("If it is sunny, go to the park. If it is rainy, stay home."),
+            "weather": (N_("sunny"), "☀️"),
+            "answer": N_("Go to the park"),
+            "options": [N_("Go to the park"), N_("Stay home"), N_("Go to school")]
+        },
+        {
+            "condition": N_("If it is sunny, go to the park. If it is rainy, stay home."),
+            "weather": (N_("rainy"), "🌧️"),
+            "answer": N_("Stay home"),
+            "options": [N_("Go to the park"), N_("Stay home"), N_("Go swimming")]
+        },
+        {
+            "condition": N_("If the light is green, walk. If the light is red, stop."),
+            "weather": (N_("green"), "🟢"),
+            "answer": N_("Walk"),
+            "options": [N_("Walk"), N_("Stop"), N_("Run")]
+        },
+        {
+            "condition": N_("If the light is green, walk. If the light is red, stop."),
+            "weather": (N_("red"), "🔴"),
+            "answer": N_("Stop"),
+            "options": [N_("Walk"), N_("Stop"), N_("Jump")]
+        },
+        {
+            "condition": N_("If you are hungry, eat food. If you are thirsty, drink water."),
+            "weather": (N_("hungry"), "🍽️"),
+            "answer": N_("Eat food"),
+            "options": [N_("Eat food"), N_("Drink water"), N_("Go to sleep")]
+        },
+        {
+            "condition": N_("If you are hungry, eat food. If you are thirsty, drink water."),
+            "weather": (N_("thirsty"), "💧"),
+            "answer": N_("Drink water"),
+            "options": [N_("Eat food"), N_("Drink water"), N_("Watch TV")]
+        },
+    ]
+
+    REPEAT_PATTERNS = [
+        {
+            "instruction": N_("Do this 3 times: Clap"),
+            "answer": "👏 👏 👏",
+            "options": ["👏 👏 👏", "👏 👏", "👏 👏 👏 👏"]
+        },
+        {
+            "instruction": N_("Do this 2 times: Jump then Spin"),
+            "answer": "⬆️ 🔄 ⬆️ 🔄",
+            "options": ["⬆️ 🔄 ⬆️ 🔄", "⬆️ ⬆️ 🔄 🔄", "⬆️ 🔄"]
+        },
+        {
+            "instruction": N_("Do this 4 times: Step right"),
+            "answer": "➡️ ➡️ ➡️ ➡️",
+            "options": ["➡️ ➡️ ➡️ ➡️", "➡️ ➡️ ➡️", "➡️ ➡️"]
+        },
+        {
+            "instruction": N_("Do this 2 times: Wave"),
+            "answer": "👋 👋",
+            "options": ["👋 👋", "👋 👋 👋", "👋"]
+        },
+    ]
+
+    # Each option lists the steps in some order; the first is the correct one
+    SEQUENCES = [
+        {
+            "task": N_("How do you make a sandwich?"),
+            "steps": (N_("Get bread"), N_("Add filling"), N_("Close sandwich")),
+            "orders": [(0, 1, 2), (1, 0, 2), (2, 0, 1)]
+        },
+        {
+            "task": N_("How do you brush your teeth?"),
+            "steps": (N_("Get toothbrush"), N_("Add toothpaste"), N_("Brush teeth")),
+            "orders": [(0, 1, 2), (2, 1, 0), (1, 2, 0)]
+        },
+        {
+            "task": N_("How do you get dressed?"),
+            "steps": (N_("Put on shirt"), N_("Put on pants"), N_("Put on shoes")),
+            "orders": [(0, 1, 2), (2, 0, 1), (1, 2, 0)]
+        },
+        {
+            "task": N_("How do you plant a seed?"),
+            "steps": (N_("Dig a hole"), N_("Put in seed"), N_("Cover with soil")),
+            "orders": [(0, 1, 2), (1, 0, 2), (2, 1, 0)]
+        },
+    ]
+
+    CASES = (
+        ('_generate_maze', 9 * 8, 2),  # robot cell, different star cell
+        ('_generate_debug', len(DEBUG_SCENARIOS), 1),
+        ('_generate_conditional', len(CONDITIONAL_SCENARIOS), 1),
+        ('_generate_repeat', len(REPEAT_PATTERNS), 1),
+        ('_generate_sequence', len(SEQUENCES), 1),
+    )
+
     def __init__(self):
         self.grid_size = 3
         self.moves = {
@@ -786,24 +1175,16 @@ class CodingQuestions:
             '⬅️': (0, -1),
             '➡️': (0, 1)
         }
+        self.opposite = {'⬆️': '⬇️', '⬇️': '⬆️', '⬅️': '➡️', '➡️': '⬅️'}
+        self.cells = [(r, c) for r in range(self.grid_size) for c in range(self.grid_size)]
+        super().__init__()
 
-    def generate(self):
-        mode = random.choice(['maze', 'maze', 'debug', 'conditional', 'repeat', 'sequence'])
-        if mode == 'maze':
-            return self._generate_maze()
-        elif mode == 'debug':
-            return self._generate_debug()
-        elif mode == 'conditional':
-            return self._generate_conditional()
-        elif mode == 'repeat':
-            return self._generate_repeat()
-        else:
-            return self._generate_sequence()
-
-    def _generate_maze(self):
+    def _generate_maze(self, i, mix):
         """Get the Robot to the Star puzzle."""
-        cells = [(r, c) for r in range(self.grid_size) for c in range(self.grid_size)]
-        start, end = random.sample(cells, 2)
+        start_idx, end_idx = divmod(i, len(self.cells) - 1)
+        if end_idx >= start_idx:
+            end_idx += 1
+        start, end = self.cells[start_idx], self.cells[end_idx]
 
         path = []
         curr_r, curr_c = start
@@ -825,19 +1206,36 @@ class CodingQuestions:
                 path.append('⬅️')
                 curr_c -= 1
 
+        # Wrong orderings first; short or uniform paths have too few of
+        # those, so a wrong first step and a stray extra move come next.
+        stray = list(self.moves)[mix % 4]
+        candidates = (
+            path[1:] + path[:1],
+            path[::-1],
+            [self.opposite[path[0]]] + path[1:],
+            path + [stray],
+        )
+        fakes = []
+        for fake_path in candidates:
+            if fake_path != path and fake_path not in fakes:
+                fakes.append(fake_path)
+                if len(fakes) == 2:
+                    break
         correct_code = " ".join(path)
-        options = {correct_code}
+        options = [correct_code] + [" ".join(fake_path) for fake_path in fakes]
 
-        while len(options) < 3:
-            fake_path = path.copy()
-            if len(fake_path) > 1:
-                random.shuffle(fake_path)
-            else:
-                fake_path.append(random.choice(list(self.moves.keys())))
-            fake_str = " ".join(fake_path)
-            if fake_str != correct_code:
-                options.add(fake_str)
+        return {
+            "type": "coding",
+            "strand": _("Coding"),
+            "q": _("Which code gets the Robot to the Star?") + "<br>" + _fragment('maze', self._maze_grid, start_idx, end_idx),
+            "a": correct_code,
+            "options": _ordered(options, mix // 4)
+        }
 
+    @functools.lru_cache(maxsize=None)
+    def _maze_grid(self, start_idx, end_idx):
+        """Maze table for one of the 72 start/end layouts, rendered once each."""
+        start, end = self.cells[start_idx], self.cells[end_idx]
         grid_html = "<table class='maze-grid'>"
         for r in range(self.grid_size):
             grid_html += "<tr>"
@@ -850,228 +1248,86 @@ class CodingQuestions:
                 grid_html += f"<td>{cell_content}</td>"
             grid_html += "</tr>"
         grid_html += "</table>"
+        return grid_html
 
-        return {
-            "type": "coding",
-            "strand": _("Coding"),
-            "q": _("Which code gets the Robot to the Star?") + f"<br>{grid_html}",
-            "a": correct_code,
-            "options": list(options)
-        }
-
-    def _generate_debug(self):
+    def _generate_debug(self, i, mix):
         """Find the bug in the code."""
-        scenarios = [
-            {
-                "task": _("The robot wants to go RIGHT then DOWN."),
-                "buggy": "⬇️ ➡️",
-                "correct": "➡️ ⬇️",
-                "bug_explanation": _("The steps are in the wrong order!")
-            },
-            {
-                "task": _("The robot wants to go UP twice."),
-                "buggy": "⬆️ ⬇️",
-                "correct": "⬆️ ⬆️",
-                "bug_explanation": _("The second step goes the wrong way!")
-            },
-            {
-                "task": _("The robot wants to go LEFT then LEFT again."),
-                "buggy": "⬅️ ➡️",
-                "correct": "⬅️ ⬅️",
-                "bug_explanation": _("The second step goes the wrong way!")
-            },
-            {
-                "task": _("The robot wants to go DOWN then RIGHT."),
-                "buggy": "➡️ ⬇️",
-                "correct": "⬇️ ➡️",
-                "bug_explanation": _("The steps are backwards!")
-            },
-        ]
-        scenario = random.choice(scenarios)
-
-        question = f'''
-            {scenario["task"]}<br><br>
-            <div style="background:#fff3cd;padding:15px;border-radius:10px;margin:10px 0;">
-                <b>''' + _("Code:") + f'''</b> <span style="font-size:1.5rem;">{scenario["buggy"]}</span>
-            </div>
-            <p>''' + _("This code has a bug! Which code is correct?") + '''</p>
-        '''
+        scenario = self.DEBUG_SCENARIOS[i]
+
+        question = (
+            f"{_(scenario['task'])}<br><br>"
+            f"<div class='code-box debug'><b>{_('Code:')}</b> <span class='q-sm'>{scenario['buggy']}</span></div>"
+            f"<p>{_('This code has a bug! Which code is correct?')}</p>"
+        )
 
         wrong_options = [
             scenario["buggy"],
             scenario["buggy"].replace("⬆️", "⬇️") if "⬆️" in scenario["buggy"] else scenario["buggy"] + " ➡️"
         ]
         options = [scenario["correct"]] + [w for w in wrong_options if w != scenario["correct"]][:2]
-        random.shuffle(options)
 
         return {
             "type": "coding",
             "strand": _("Coding"),
             "q": question,
             "a": scenario["correct"],
-            "options": options
+            "options": _ordered(options, mix)
         }
 
-    def _generate_conditional(self):
+    def _generate_conditional(self, i, mix):
         """If-then scenarios for Grade 1."""
-        scenarios = [
-            {
-                "condition": _("If it is sunny, go to the park. If it is rainy, stay home."),
-                "weather": _("sunny") + " ☀️",
-                "answer": _("Go to the park"),
-                "options": [_("Go to the park"), _("Stay home"), _("Go to school")]
-            },
-            {
-                "condition": _("If it is sunny, go to the park. If it is rainy, stay home."),
-                "weather": _("rainy") + " 🌧️",
-                "answer": _("Stay home"),
-                "options": [_("Go to the park"), _("Stay home"), _("Go swimming")]
-            },
-            {
-                "condition": _("If the light is green, walk. If the light is red, stop."),
-                "weather": _("green") + " 🟢",
-                "answer": _("Walk"),
-                "options": [_("Walk"), _("Stop"), _("Run")]
-            },
-            {
-                "condition": _("If the light is green, walk. If the light is red, stop."),
-                "weather": _("red") + " 🔴",
-                "answer": _("Stop"),
-                "options": [_("Walk"), _("Stop"), _("Jump")]
-            },
-            {
-                "condition": _("If you are hungry, eat food. If you are thirsty, drink water."),
-                "weather": _("hungry") + " 🍽️",
-                "answer": _("Eat food"),
-                "options": [_("Eat food"), _("Drink water"), _("Go to sleep")]
-            },
-            {
-                "condition": _("If you are hungry, eat food. If you are thirsty, drink water."),
-                "weather": _("thirsty") + " 💧",
-                "answer": _("Drink water"),
-                "options": [_("Eat food"), _("Drink water"), _("Watch TV")]
-            },
-        ]
-        scenario = random.choice(scenarios)
-
-        question = f'''
-            <div style="background:#e8f4fc;padding:15px;border-radius:10px;margin:10px 0;">
-                <b>''' + _("Rule:") + f'''</b> {scenario["condition"]}
-            </div>
-            <p>''' + _("Today it is") + f''' <b>{scenario["weather"]}</b>. ''' + _("What should you do?") + '''</p>
-        '''
+        scenario = self.CONDITIONAL_SCENARIOS[i]
+        situation, emoji = scenario["weather"]
+        answer = scenario["answer"]
 
-        options = scenario["options"].copy()
-        random.shuffle(options)
+        question = (
+            f"<div class='code-box rule'><b>{_('Rule:')}</b> {_(scenario['condition'])}</div>"
+            f"<p>{_('Today it is')} <b>{_(situation)} {emoji}</b>. {_('What should you do?')}</p>"
+        )
 
         return {
             "type": "coding",
             "strand": _("Coding"),
             "q": question,
-            "a": scenario["answer"],
-            "options": options
+            "a": _(answer),
+            "options": _ordered([_(option) for option in scenario["options"]], mix)
         }
 
-    def _generate_repeat(self):
+    def _generate_repeat(self, i, mix):
         """Loop/repeat patterns."""
-        patterns = [
-            {
-                "instruction": _("Do this 3 times: Clap"),
-                "answer": "👏 👏 👏",
-                "options": ["👏 👏 👏", "👏 👏", "👏 👏 👏 👏"]
-            },
-            {
-                "instruction": _("Do this 2 times: Jump then Spin"),
-                "answer": "⬆️ 🔄 ⬆️ 🔄",
-                "options": ["⬆️ 🔄 ⬆️ 🔄", "⬆️ ⬆️ 🔄 🔄", "⬆️ 🔄"]
-            },
-            {
-                "instruction": _("Do this 4 times: Step right"),
-                "answer": "➡️ ➡️ ➡️ ➡️",
-                "options": ["➡️ ➡️ ➡️ ➡️", "➡️ ➡️ ➡️", "➡️ ➡️"]
-            },
-            {
-                "instruction": _("Do this 2 times: Wave"),
-                "answer": "👋 👋",
-                "options": ["👋 👋", "👋 👋 👋", "👋"]
-            },
-        ]
-        pattern = random.choice(patterns)
+        pattern = self.REPEAT_PATTERNS[i]
 
-        question = f'''
-            <div style="background:#f0fff0;padding:15px;border-radius:10px;margin:10px 0;">
-                <b>''' + _("Instruction:") + f'''</b> {pattern["instruction"]}
-            </div>
-            <p>''' + _("What does this look like?") + '''</p>
-        '''
-
-        options = pattern["options"].copy()
-        random.shuffle(options)
+        question = (
+            f"<div class='code-box loop'><b>{_('Instruction:')}</b> {_(pattern['instruction'])}</div>"
+            f"<p>{_('What does this look like?')}</p>"
+        )
 
         return {
             "type": "coding",
             "strand": _("Coding"),
             "q": question,
             "a": pattern["answer"],
-            "options": options
+            "options": _ordered(pattern["options"], mix)
         }
 
-    def _generate_sequence(self):
+    def _generate_sequence(self, i, mix):
         """Order the steps correctly."""
-        sequences = [
-            {
-                "task": _("How do you make a sandwich?"),
-                "correct": _("Get bread") + " → " + _("Add filling") + " → " + _("Close sandwich"),
-                "options": [
-                    _("Get bread") + " → " + _("Add filling") + " → " + _("Close sandwich"),
-                    _("Add filling") + " → " + _("Get bread") + " → " + _("Close sandwich"),
-                    _("Close sandwich") + " → " + _("Get bread") + " → " + _("Add filling")
-                ]
-            },
-            {
-                "task": _("How do you brush your teeth?"),
-                "correct": _("Get toothbrush") + " → " + _("Add toothpaste") + " → " + _("Brush teeth"),
-                "options": [
-                    _("Get toothbrush") + " → " + _("Add toothpaste") + " → " + _("Brush teeth"),
-                    _("Brush teeth") + " → " + _("Add toothpaste") + " → " + _("Get toothbrush"),
-                    _("Add toothpaste") + " → " + _("Brush teeth") + " → " + _("Get toothbrush")
-                ]
-            },
-            {
-                "task": _("How do you get dressed?"),
-                "correct": _("Put on shirt") + " → " + _("Put on pants") + " → " + _("Put on shoes"),
-                "options": [
-                    _("Put on shirt") + " → " + _("Put on pants") + " → " + _("Put on shoes"),
-                    _("Put on shoes") + " → " + _("Put on shirt") + " → " + _("Put on pants"),
-                    _("Put on pants") + " → " + _("Put on shoes") + " → " + _("Put on shirt")
-                ]
-            },
-            {
-                "task": _("How do you plant a seed?"),
-                "correct": _("Dig a hole") + " → " + _("Put in seed") + " → " + _("Cover with soil"),
-                "options": [
-                    _("Dig a hole") + " → " + _("Put in seed") + " → " + _("Cover with soil"),
-                    _("Put in seed") + " → " + _("Dig a hole") + " → " + _("Cover with soil"),
-                    _("Cover with soil") + " → " + _("Put in seed") + " → " + _("Dig a hole")
-                ]
-            },
-        ]
-        seq = random.choice(sequences)
+        seq = self.SEQUENCES[i]
+        steps = [_(step) for step in seq["steps"]]
 
-        question = f'''
-            <p><b>{seq["task"]}</b></p>
-            <p>''' + _("Put the steps in the correct order:") + '''</p>
-        '''
+        question = (
+            f"<p><b>{_(seq['task'])}</b></p>"
+            f"<p>{_('Put the steps in the correct order:')}</p>"
+        )
 
-        options = seq["options"].copy()
-        random.shuffle(options)
+        options = [" → ".join(steps[n] for n in order) for order in seq["orders"]]
 
         return {
             "type": "coding",
             "strand": _("Coding"),
             "q": question,
-            "a": seq["correct"],
-            "options": options
+            "a": options[0],
+            "options": _ordered(options, mix)
         }
 
 
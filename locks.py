@@ -0,0 +1,26 @@
+"""Advisory file locks, shared across gunicorn workers."""
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single-process use only
+    fcntl = None
+
+
+class FileLock:
+    """Advisory lock on an open file, shared across gunicorn workers."""
+
+    def __init__(self, f, exclusive):
+        self.f = f
+        if fcntl is None:
+            self.mode = None
+        else:
+            self.mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+
+    def __enter__(self):
+        if self.mode is not None:
+            fcntl.flock(self.f.fileno(), self.mode)
+        return self.f
+
+    def __exit__(self, *exc):
+        if self.mode is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,266 @@
+import itertools
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+from locks import FileLock, fcntl
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionPool:
+    """Per-key pools of pre-generated questions, e.g. per (strand, locale).
+
+    A background thread keeps every pool topped up: once a pool drops below
+    `low_water` it is refilled back to `size`, generating at most
+    `refill_rate` questions per second so refills never hog a worker's CPU.
+    get() is a deque pop; if a pool is empty it falls back to generating
+    the question inline and counts a miss.
+
+    `generate(*key)` must be callable from any thread.
+    """
+
+    def __init__(self, generate, keys, size=50, low_water=10, refill_rate=200.0):
+        self._generate = generate
+        self.size = size
+        self.low_water = low_water
+        self.refill_rate = refill_rate
+        self._pools = {key: deque() for key in keys}
+        self._wake = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self._thread = threading.Thread(target=self._run, name='question-pool', daemon=True)
+        self._thread.start()
+
+    def get(self, *key):
+        """Pop a ready question, generating one inline if the pool is dry."""
+        pool = self._pools.get(key)
+        if pool is None:
+            return self._generate(*key)
+        try:
+            question = pool.popleft()
+            self.hits += 1
+        except IndexError:
+            self.misses += 1
+            question = self._generate(*key)
+        if len(pool) < self.low_water:
+            self._wake.set()
+        return question
+
+    def get_json(self, *key):
+        return json.dumps(self.get(*key)).encode()
+
+    def _refill(self, key, pool):
+        while len(pool) < self.size:
+            try:
+                pool.append(self._generate(*key))
+            except Exception:
+                logger.exception('Could not generate a pooled %s question', key)
+                return
+            self.generated += 1
+            time.sleep(1.0 / self.refill_rate)
+
+    def _run(self):
+        while True:
+            for key, pool in self._pools.items():
+                if len(pool) < self.low_water:
+                    self._refill(key, pool)
+            self._wake.wait(timeout=1.0)
+            self._wake.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'generated': self.generated,
+            'ready': sum(len(pool) for pool in self._pools.values()),
+            'capacity': self.size * len(self._pools),
+        }
+
+
+class SharedQuestionStore:
+    """Pre-rendered question JSON in a memory-mapped file shared by all workers.
+
+    The file holds one ring of fixed-size slots per key. Exactly
+    one process at a time -- whichever holds the producer flock -- generates
+    questions into the rings; every worker reads slots straight out of the
+    mapping, so warm-up CPU and memory don't grow with the worker count. If
+    the producer exits, another worker takes the lock over.
+
+    Each slot is guarded by a sequence number that is odd while the slot is
+    being written; readers retry or fall back to inline generation if it
+    changes under them. Readers bump a per-ring counter that tells the
+    producer which rings to refresh (lost increments only delay a refresh).
+
+    The file name ends in a checksum of the layout (keys, slots, slot
+    size) and of `version`, which should identify the code generating the
+    questions: the file outlives the processes using it, so a redeploy
+    must not serve questions generated by the previous build. A file
+    is never truncated while mapped: a new or damaged one is built under a
+    temporary name and renamed into place.
+
+    `generate(*key)` must return a JSON-serialisable question.
+    """
+
+    MAGIC = b'mathq001'
+    HEADER = struct.Struct('<8sIII')  # magic, slots, slot_size, layout checksum
+    RING_HEADER = struct.Struct('<QQ')  # slots written, reads
+    COUNTER = struct.Struct('<Q')
+    SLOT_HEADER = struct.Struct('<QI')  # sequence, payload length
+
+    def __init__(self, generate, keys, path, slots=64, slot_size=4096, refill_rate=200.0, version=''):
+        self._generate = generate
+        self.keys = list(keys)
+        self._index = {key: i for i, key in enumerate(self.keys)}
+        self.slots = slots
+        self.slot_size = slot_size
+        self.refill_rate = refill_rate
+        self._ring_size = self.RING_HEADER.size + slots * slot_size
+        self._checksum = zlib.crc32(repr((self.MAGIC, version, self.keys, slots, slot_size)).encode())
+        self.path = f'{path}-{self._checksum:08x}'
+        self._cursors = {key: itertools.count(random.randrange(slots)) for key in self.keys}
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.producer = False
+        self._map = self._open()
+        self._thread = threading.Thread(target=self._run, name='question-store', daemon=True)
+        self._thread.start()
+
+    def _valid(self, size, expected):
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            return os.fstat(fd).st_size == size and os.pread(fd, self.HEADER.size, 0) == expected
+        finally:
+            os.close(fd)
+
+    def _open(self):
+        size = self.HEADER.size + len(self.keys) * self._ring_size
+        expected = self.HEADER.pack(self.MAGIC, self.slots, self.slot_size, self._checksum)
+        # Serialises creation, so every process ends up mapping the same file
+        with open(self.path + '.init', 'a') as init_lock, FileLock(init_lock, exclusive=True):
+            if not self._valid(size, expected):
+                tmp = f'{self.path}.{os.getpid()}.tmp'
+                fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+                try:
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, expected, 0)
+                finally:
+                    os.close(fd)
+                os.rename(tmp, self.path)
+            fd = os.open(self.path, os.O_RDWR)
+        try:
+            return mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def _ring(self, i):
+        return self.HEADER.size + i * self._ring_size
+
+    def _slot(self, i, n):
+        return self._ring(i) + self.RING_HEADER.size + n * self.slot_size
+
+    def _read_slot(self, offset):
+        for _attempt in range(3):
+            seq, length = self.SLOT_HEADER.unpack_from(self._map, offset)
+            if seq % 2 or not length:
+                return None
+            start = offset + self.SLOT_HEADER.size
+            payload = self._map[start:start + length]
+            if self.SLOT_HEADER.unpack_from(self._map, offset)[0] == seq:
+                return payload
+        return None
+
+    def _write_slot(self, offset, payload):
+        seq = self.SLOT_HEADER.unpack_from(self._map, offset)[0]
+        self.SLOT_HEADER.pack_into(self._map, offset, seq + 1, 0)
+        start = offset + self.SLOT_HEADER.size
+        self._map[start:start + len(payload)] = payload
+        self.SLOT_HEADER.pack_into(self._map, offset, seq + 2, len(payload))
+
+    def _encode(self, key):
+        return json.dumps(self._generate(*key)).encode()
+
+    def get_json(self, *key):
+        """Next question for key as JSON bytes."""
+        i = self._index.get(key)
+        if i is None:
+            return self._encode(key)
+        payload = self._read_slot(self._slot(i, next(self._cursors[key]) % self.slots))
+        reads_at = self._ring(i) + self.COUNTER.size
+        self.COUNTER.pack_into(self._map, reads_at, self.COUNTER.unpack_from(self._map, reads_at)[0] + 1)
+        if payload is None:
+            self.misses += 1
+            return self._encode(key)
+        self.hits += 1
+        return payload
+
+    def _fill(self, i, count):
+        key = self.keys[i]
+        ring = self._ring(i)
+        for _n in range(count):
+            try:
+                payload = self._encode(key)
+            except Exception:
+                logger.exception('Could not generate a shared %s question', key)
+                return
+            if len(payload) > self.slot_size - self.SLOT_HEADER.size:
+                logger.warning('Skipping %d-byte %s question: larger than a slot', len(payload), key)
+                continue
+            written = self.COUNTER.unpack_from(self._map, ring)[0]
+            self._write_slot(self._slot(i, written % self.slots), payload)
+            self.COUNTER.pack_into(self._map, ring, written + 1)
+            self.generated += 1
+            time.sleep(1.0 / self.refill_rate)
+
+    def _become_producer(self):
+        if fcntl is None:  # no flock: assume a single process
+            return True
+        self._lock_file = open(self.path + '.lock', 'a')
+        while True:
+            try:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                time.sleep(1.0)
+
+    def _run(self):
+        self._become_producer()
+        self.producer = True
+        # Fill any slots a previous producer never reached, then keep
+        # rewriting as many slots in each ring as were read since last pass
+        seen = []
+        for i in range(len(self.keys)):
+            written, reads = self.RING_HEADER.unpack_from(self._map, self._ring(i))
+            seen.append(reads)
+            self._fill(i, max(0, self.slots - written))
+        while True:
+            idle = True
+            for i in range(len(self.keys)):
+                reads = self.RING_HEADER.unpack_from(self._map, self._ring(i))[1]
+                if reads != seen[i]:
+                    self._fill(i, min(reads - seen[i], self.slots))
+                    seen[i] = reads
+                    idle = False
+            if idle:
+                time.sleep(0.1)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'generated': self.generated,
+            'producer': self.producer,
+            'capacity': self.slots * len(self.keys),
+        }
@@ -1,57 +1,115 @@
-const CACHE_NAME = 'math-adventure-v1';
-const STATIC_ASSETS = [
-  '/',
-  '/static/style.css',
-  '/static/manifest.json',
-  '/static/icons/icon-192.png',
-  '/static/icons/icon-512.png'
-];
+// ASSETS_VERSION and PRECACHE_URLS (the content-hashed static asset URLs,
+// from the build-generated asset-manifest.json) are prepended by the server
+// when it serves this file from /service-worker.js
+const CACHE_NAME = `math-adventure-${ASSETS_VERSION}`;
+// Pages link to hashed assets, so they are versioned along with them
+const PAGES_CACHE = `math-adventure-pages-v2-${ASSETS_VERSION}`;
+// Only pages that look the same for every guest are kept for offline use;
+// the server marks anything user-specific no-store
+const PUBLIC_PAGES = [/^\/$/, /^\/quiz\/[a-z]+$/];
+const PRECACHED = new Set(PRECACHE_URLS);
+// How long a page request may take before the cached copy is shown
+const NETWORK_TIMEOUT_MS = 3000;
 
 // Install event - cache static assets
 self.addEventListener('install', (event) => {
   event.waitUntil(
-    caches.open(CACHE_NAME).then((cache) => {
-      return cache.addAll(STATIC_ASSETS);
-    })
+    caches.open(CACHE_NAME).then((cache) => cache.addAll(PRECACHE_URLS))
   );
   self.skipWaiting();
 });
 
-// Activate event - clean up old caches
+// Activate event - drop caches from previous asset versions
 self.addEventListener('activate', (event) => {
   event.waitUntil(
-    caches.keys().then((cacheNames) => {
-      return Promise.all(
+    Promise.all([
+      caches.keys().then((cacheNames) => Promise.all(
         cacheNames
-          .filter((name) => name !== CACHE_NAME)
+          .filter((name) => name !== CACHE_NAME && name !== PAGES_CACHE)
           .map((name) => caches.delete(name))
-      );
-    })
+      )),
+      self.registration.navigationPreload && self.registration.navigationPreload.enable()
+    ])
   );
   self.clients.claim();
 });
 
-// Fetch event - network first, fallback to cache
+function isPublicPage(url) {
+  return url.origin === self.location.origin && PUBLIC_PAGES.some((page) => page.test(url.pathname));
+}
+
+function cacheablePage(response) {
+  const cacheControl = response.headers.get('Cache-Control') || '';
+  return response.ok && !/no-store|private/.test(cacheControl);
+}
+
+// Public pages: network first so content is current, falling back to the
+// last cached copy when offline or when the network is too slow
+function networkFirst(event) {
+  let saved = Promise.resolve();
+  const network = Promise.resolve(event.preloadResponse)
+    .then((preloaded) => preloaded || fetch(event.request))
+    .then((response) => {
+      if (cacheablePage(response)) {
+        const copy = response.clone();
+        saved = caches.open(PAGES_CACHE).then((cache) => cache.put(event.request, copy));
+      }
+      return response;
+    });
+  // Keep the cached copy current even when the cache answered first
+  event.waitUntil(network.then(() => saved, () => {}));
+
+  const cachedOrNetwork = () => caches.match(event.request).then((cached) => cached || network);
+  const timeout = new Promise((resolve) => setTimeout(resolve, NETWORK_TIMEOUT_MS)).then(cachedOrNetwork);
+  return Promise.race([network, timeout]).catch(cachedOrNetwork);
+}
+
+// Other static files: answer from the cache and refresh it in the background
+function staleWhileRevalidate(event) {
+  return caches.open(CACHE_NAME).then((cache) =>
+    cache.match(event.request).then((cached) => {
+      const refresh = fetch(event.request).then((response) => {
+        if (response.ok || response.type === 'opaque') {
+          return cache.put(event.request, response.clone()).then(() => response);
+        }
+        return response;
+      });
+      if (cached) {
+        event.waitUntil(refresh.catch(() => {}));
+        return cached;
+      }
+      return refresh;
+    })
+  );
+}
+
 self.addEventListener('fetch', (event) => {
   // Skip non-GET requests
   if (event.request.method !== 'GET') return;
 
   // Skip API calls - always go to network
-  if (event.request.url.includes('/api/')) return;
-
-  event.respondWith(
-    fetch(event.request)
-      .then((response) => {
-        // Clone the response and cache it
-        const responseClone = response.clone();
-        caches.open(CACHE_NAME).then((cache) => {
-          cache.put(event.request, responseClone);
-        });
-        return response;
-      })
-      .catch(() => {
-        // Network failed, try cache
-        return caches.match(event.request);
-      })
-  );
+  const url = new URL(event.request.url);
+  if (url.pathname.startsWith('/api/')) return;
+
+  if (event.request.mode === 'navigate') {
+    if (isPublicPage(url)) {
+      event.respondWith(networkFirst(event));
+    } else {
+      // Other pages go straight to the network and are never cached
+      event.respondWith(Promise.resolve(event.preloadResponse).then((preloaded) => preloaded || fetch(event.request)));
+    }
+    return;
+  }
+
+  // Hashed assets never change: serve them from the cache without a request
+  if (url.origin === self.location.origin && PRECACHED.has(url.pathname)) {
+    event.respondWith(
+      caches.match(event.request).then((cached) => cached || fetch(event.request))
+    );
+    return;
+  }
+
+  if (['style', 'script', 'font', 'image', 'manifest'].includes(event.request.destination)) {
+    event.respondWith(staleWhileRevalidate(event));
+  }
 });
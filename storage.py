@@ -0,0 +1,998 @@
+"""History and user storage backends.
+
+app.py talks to one Storage object, picked by create_storage() from the
+STORAGE_BACKEND setting: Postgres, SQLite (WAL mode) or a JSON-lines file.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions as _ext
+from psycopg2 import pool
+from psycopg2.extras import RealDictCursor, execute_values
+
+from locks import FileLock
+
+# Fields the history listing needs; the full document is only read on review
+HISTORY_SUMMARY_FIELDS = ('id', 'date', 'strand', 'mood', 'score_str', 'percent')
+USER_FIELDS = ('id', 'google_id', 'email', 'name', 'picture')
+
+logger = logging.getLogger(__name__)
+
+
+def _numbered_placeholders(sql):
+    """Turn psycopg2 %s placeholders into PREPARE-style $1, $2, ..."""
+    parts = sql.split('%s')
+    return parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], start=1))
+
+def _now():
+    """Timestamp for new rows; fixed precision keeps string ordering exact."""
+    return datetime.now().isoformat(timespec='microseconds')
+
+def encode_history_cursor(created_at, record_id):
+    """Build the opaque keyset cursor for the row after which to continue."""
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat(timespec='microseconds')
+    return f"{created_at}|{record_id}"
+
+def decode_history_cursor(cursor):
+    """Parse a cursor into (created_at, id); returns None if it is malformed."""
+    created_at, sep, record_id = (cursor or '').partition('|')
+    if not sep or not record_id:
+        return None
+    try:
+        return datetime.fromisoformat(created_at), record_id
+    except ValueError:
+        return None
+
+
+class Autocommit(str):
+    """A migration statement that cannot run inside a transaction block,
+    such as CREATE INDEX CONCURRENTLY."""
+
+
+# Schema migrations, applied in order. Migration N is entry N-1; never edit
+# or reorder an entry once deployed, append a new one instead. Migrations
+# run while the previous release is still serving, so indexes on existing
+# tables are built CONCURRENTLY to keep history writable.
+POSTGRES_MIGRATIONS = [
+    # 1: users and history tables
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            google_id TEXT UNIQUE NOT NULL,
+            email TEXT NOT NULL,
+            name TEXT,
+            picture TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS history (
+            id TEXT PRIMARY KEY,
+            data JSONB NOT NULL,
+            user_id INTEGER REFERENCES users(id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # For tables created before history had an owner
+        'ALTER TABLE history ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id)',
+        'CREATE INDEX IF NOT EXISTS idx_history_user_id ON history(user_id)',
+    ],
+    # 2: serves the keyset-paginated, newest-first history listing
+    [
+        Autocommit('CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_history_user_created '
+                   'ON history(user_id, created_at DESC, id DESC)'),
+    ],
+    # 3: idx_history_user_created covers every user_id lookup
+    [
+        Autocommit('DROP INDEX CONCURRENTLY IF EXISTS idx_history_user_id'),
+    ],
+]
+
+SQLITE_MIGRATIONS = [
+    # 1: users and history tables
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            google_id TEXT UNIQUE NOT NULL,
+            email TEXT NOT NULL,
+            name TEXT,
+            picture TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS history (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            user_id INTEGER REFERENCES users(id),
+            created_at TEXT NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_history_user_created ON history(user_id, created_at DESC, id DESC)',
+    ],
+]
+
+# Key for pg_advisory_lock around migrations ("math" in ASCII)
+MIGRATION_LOCK_ID = 0x6d617468
+
+
+class Storage:
+    """Interface shared by every backend.
+
+    Users are returned as plain dicts with USER_FIELDS; history pages as
+    (records, next_cursor) with records newest first.
+    """
+
+    # Whether load_user can find users made by get_or_create_user; callers
+    # must not cache users (and so keep them logged in) when it can't
+    persists_users = True
+
+    def init(self):
+        """Make sure the schema is current; cheap when it already is."""
+
+    def migrate(self):
+        """Apply any pending schema migrations. Returns the schema version."""
+        return 0
+
+    def load_user(self, user_id):
+        raise NotImplementedError
+
+    def get_or_create_user(self, google_id, email, name, picture):
+        raise NotImplementedError
+
+    def save_history(self, record, user_id=None):
+        raise NotImplementedError
+
+    def save_history_batch(self, items):
+        """Save [(record, user_id), ...]; backends override to use one commit."""
+        for record, user_id in items:
+            self.save_history(record, user_id)
+
+    def load_history(self, user_id=None, before=None, limit=None, summary=False):
+        """Load history newest first, one keyset page at a time.
+
+        `before` is a cursor returned by a previous call; `limit` caps the page
+        size (None loads everything). With `summary`, only
+        HISTORY_SUMMARY_FIELDS are returned for each record.
+        """
+        raise NotImplementedError
+
+    def get_history_record(self, session_id, user_id=None):
+        """Fetch one session by id, only if it belongs to user_id."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Backend counters for /metrics."""
+        return {}
+
+    def ready(self):
+        """Whether this worker can serve storage requests; must not query."""
+        return True
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within the acquire timeout."""
+
+
+class BlockingConnectionPool(pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool that waits for a free connection.
+
+    psycopg2's pool raises PoolError as soon as maxconn connections are out.
+    Here getconn() waits up to `timeout` seconds for one to be returned and
+    then raises PoolTimeout, which the app turns into a 503. Wait times,
+    timeouts and in-use/idle counts are recorded for /metrics.
+
+    psycopg2 also closes every returned connection once minconn are idle;
+    here up to maxconn stay open, so a connection opened for one burst
+    (with its prepared statements) serves the next. Idle connections are
+    retired by the max_lifetime and validate_after checks on borrow.
+    """
+
+    def __init__(self, minconn, maxconn, *args, timeout=5.0, max_lifetime=1800.0,
+                 validate_after=30.0, **kwargs):
+        self._born = {}         # id(conn) -> time it was opened
+        self._idle_since = {}   # id(conn) -> time it was last returned
+        self._prepared = {}     # id(conn) -> names of statements prepared on it
+        self.max_lifetime = max_lifetime
+        self.validate_after = validate_after
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recycled = 0
+        # Opens minconn connections right away, warming the pool
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        self._born[id(conn)] = self._idle_since[id(conn)] = time.monotonic()
+        return conn
+
+    def _forget(self, conn):
+        self._born.pop(id(conn), None)
+        self._idle_since.pop(id(conn), None)
+        self._prepared.pop(id(conn), None)
+
+    def prepared(self, conn):
+        """Set of prepared statement names that exist on this connection."""
+        return self._prepared.setdefault(id(conn), set())
+
+    def _healthy(self, conn):
+        """Validate a connection on borrow.
+
+        Closed, broken or over-age connections fail without a round trip;
+        only a connection idle longer than validate_after gets a SELECT 1,
+        to catch server-side idle timeouts and failovers.
+        """
+        if conn.closed or conn.info.transaction_status == _ext.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        now = time.monotonic()
+        if now - self._born.get(id(conn), now) > self.max_lifetime:
+            return False
+        if now - self._idle_since.get(id(conn), now) > self.validate_after:
+            try:
+                cur = conn.cursor()
+                cur.execute('SELECT 1')
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self, key=None):
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._stats_lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No database connection free after {self.timeout}s")
+        wait = time.monotonic() - start
+        with self._stats_lock:
+            self.acquired += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            if wait > 0.001:
+                self.waited += 1
+        try:
+            conn = super().getconn(key)
+            # Every idle connection may be stale, so try at most all of them
+            for _attempt in range(self.maxconn):
+                if self._healthy(conn):
+                    return conn
+                with self._stats_lock:
+                    self.recycled += 1
+                super().putconn(conn, key, close=True)
+                self._forget(conn)
+                conn = super().getconn(key)
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _putconn(self, conn, key=None, close=False):
+        # As psycopg2's _putconn, but keeps up to maxconn (not minconn) idle
+        if self.closed:
+            raise pool.PoolError("connection pool is closed")
+        if key is None:
+            key = self._rused.get(id(conn))
+            if key is None:
+                raise pool.PoolError("trying to put unkeyed connection")
+        if close or conn.closed or conn.info.transaction_status == _ext.TRANSACTION_STATUS_UNKNOWN:
+            conn.close()
+        else:
+            if conn.info.transaction_status != _ext.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self._pool.append(conn)
+        if not self.closed or key in self._used:
+            del self._used[key]
+            del self._rused[id(conn)]
+
+    def putconn(self, conn=None, key=None, close=False):
+        super().putconn(conn, key, close)
+        if conn.closed:
+            self._forget(conn)
+        else:
+            self._idle_since[id(conn)] = time.monotonic()
+        self._slots.release()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'in_use': len(self._used),
+                'idle': len(self._pool),
+                'max': self.maxconn,
+                'acquired': self.acquired,
+                'waited': self.waited,
+                'timeouts': self.timeouts,
+                'wait_avg_ms': round(1000 * self.wait_total / self.acquired, 3) if self.acquired else 0.0,
+                'wait_max_ms': round(1000 * self.wait_max, 3),
+                'recycled': self.recycled,
+            }
+
+
+class JsonlHistoryLog:
+    """Append-only JSON-lines history log with an in-memory offset index.
+
+    Each line is {"id", "user_id", "created_at", "data"}. Saves append one
+    line under an exclusive flock, so concurrent workers never lose writes.
+    Every process keeps an index of id -> (offset, length) plus per-user
+    lists in append order, and catches up on lines written by other workers
+    by reading only the bytes past what it has already indexed.
+    """
+
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._lock = threading.Lock()
+        self._indexed_size = 0
+        self._offsets = {}   # id -> (offset, length, user_id, position)
+        self._by_user = {}   # user_id -> [(created_at, id), ...] oldest first
+        self._migrate_legacy()
+
+    def _migrate_legacy(self):
+        """Convert an old history.json array into the log, once."""
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        with open(self.path, 'a+b') as f, FileLock(f, exclusive=True):
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                return
+            try:
+                with open(self.legacy_path, 'r') as legacy:
+                    records = json.load(legacy)
+            except (OSError, json.JSONDecodeError):
+                return
+            created_at = _now()
+            for record in records:
+                f.write(self._encode(record, None, created_at))
+            f.flush()
+
+    @staticmethod
+    def _encode(record, user_id, created_at):
+        entry = {'id': record.get('id'), 'user_id': user_id, 'created_at': created_at, 'data': record}
+        return (json.dumps(entry) + '\n').encode('utf-8')
+
+    def _refresh(self):
+        """Index any complete lines appended since the last call."""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        if size <= self._indexed_size:
+            return
+        with open(self.path, 'rb') as f, FileLock(f, exclusive=False):
+            f.seek(self._indexed_size)
+            chunk = f.read()
+        # Ignore a trailing partial line; it is picked up once complete
+        end = chunk.rfind(b'\n') + 1
+        offset = self._indexed_size
+        for line in chunk[:end].splitlines(keepends=True):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                entry = None
+            if entry and entry.get('id'):
+                entries = self._by_user.setdefault(entry.get('user_id'), [])
+                self._offsets[entry['id']] = (offset, len(line), entry.get('user_id'), len(entries))
+                entries.append((entry['created_at'], entry['id']))
+            offset += len(line)
+        self._indexed_size = offset
+
+    def _read(self, f, session_id):
+        offset, length = self._offsets[session_id][:2]
+        f.seek(offset)
+        return json.loads(f.read(length))['data']
+
+    def append(self, record, user_id=None):
+        """Append one session record; O(1) regardless of history size."""
+        self.append_many([(record, user_id)])
+
+    def append_many(self, items):
+        """Append [(record, user_id), ...] with a single locked write."""
+        created_at = _now()
+        data = b''.join(self._encode(record, user_id, created_at) for record, user_id in items)
+        with open(self.path, 'ab') as f, FileLock(f, exclusive=True):
+            f.write(data)
+            f.flush()
+
+    def get(self, session_id, user_id=None):
+        """Return one session by id if it belongs to user_id, else None."""
+        with self._lock:
+            self._refresh()
+            meta = self._offsets.get(session_id)
+            if meta is None or meta[2] != user_id:
+                return None
+            with open(self.path, 'rb') as f:
+                return self._read(f, session_id)
+
+    def page(self, user_id=None, before=None, limit=None):
+        """Return (records, last_key) for one page, newest first.
+
+        `before` is the id of the last record on the previous page. last_key
+        is the (created_at, id) of the final record when more remain, else None.
+        """
+        with self._lock:
+            self._refresh()
+            entries = self._by_user.get(user_id, [])
+            end = len(entries)
+            meta = self._offsets.get(before)
+            if meta is not None and meta[2] == user_id:
+                end = meta[3]
+            start = 0 if limit is None else max(0, end - limit)
+            keys = entries[start:end][::-1]
+            if not keys:
+                return [], None
+            with open(self.path, 'rb') as f:
+                records = [self._read(f, session_id) for _created, session_id in keys]
+        return records, keys[-1] if start > 0 else None
+
+
+class JsonlStorage(Storage):
+    """File-only storage for kiosks: history in a JSONL log, no user table."""
+
+    persists_users = False
+
+    def __init__(self, path, legacy_path=None):
+        self.log = JsonlHistoryLog(path, legacy_path=legacy_path)
+
+    def load_user(self, user_id):
+        return None
+
+    def get_or_create_user(self, google_id, email, name, picture):
+        # Without a user table, use google_id hash as a simple numeric ID
+        user_id = abs(hash(google_id)) % 1000000
+        return {'id': user_id, 'google_id': google_id, 'email': email, 'name': name, 'picture': picture}
+
+    def save_history(self, record, user_id=None):
+        self.log.append(record, user_id)
+
+    def save_history_batch(self, items):
+        self.log.append_many(items)
+
+    def load_history(self, user_id=None, before=None, limit=None, summary=False):
+        position = decode_history_cursor(before)
+        history, last_key = self.log.page(user_id, before=position and position[1], limit=limit)
+        if summary:
+            history = [{k: item.get(k) for k in HISTORY_SUMMARY_FIELDS} for item in history]
+        next_cursor = encode_history_cursor(*last_key) if last_key else None
+        return history, next_cursor
+
+    def get_history_record(self, session_id, user_id=None):
+        return self.log.get(session_id, user_id)
+
+
+class PostgresStorage(Storage):
+    """Postgres storage through a per-worker ThreadedConnectionPool."""
+
+    SUMMARY_SQL = 'jsonb_build_object(' + ', '.join(
+        f"'{field}', data->'{field}'" for field in HISTORY_SUMMARY_FIELDS) + ')'
+
+    def __init__(self, dsn, minconn=1, maxconn=10, acquire_timeout=5.0,
+                 max_lifetime=1800.0, validate_after=30.0, use_prepared=True):
+        self.dsn = dsn
+        self.use_prepared = use_prepared
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.validate_after = validate_after
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._initialized = False
+
+    def get_pool(self):
+        """Get or create the database connection pool (lazy initialization)."""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = BlockingConnectionPool(
+                        minconn=self.minconn,
+                        maxconn=self.maxconn,
+                        timeout=self.acquire_timeout,
+                        max_lifetime=self.max_lifetime,
+                        validate_after=self.validate_after,
+                        dsn=self.dsn
+                    )
+        return self._pool
+
+    def stats(self):
+        if self._pool is None:
+            return {'db_pool': None}
+        return {'db_pool': self._pool.stats()}
+
+    def ready(self):
+        """Ready once migrated and the pool is open with a free slot."""
+        db_pool = self._pool
+        if not self._initialized or db_pool is None or db_pool.closed:
+            return False
+        return len(db_pool._used) < db_pool.maxconn
+
+    def _execute(self, conn, cur, name, sql, params):
+        """Run `sql` as the per-connection prepared statement `name`.
+
+        The first use on a connection sends PREPARE; later calls only send
+        EXECUTE, so Postgres skips parsing and planning. Falls back to a
+        plain execute when `name` is None or prepared statements are off
+        (e.g. behind a transaction-pooling PgBouncer).
+        """
+        if name is None or not self.use_prepared:
+            cur.execute(sql, params)
+            return
+        prepared = self._pool.prepared(conn)
+        if name not in prepared:
+            cur.execute(f'PREPARE {name} AS {_numbered_placeholders(sql)}')
+            prepared.add(name)
+        cur.execute(f'EXECUTE {name} (' + ', '.join(['%s'] * len(params)) + ')', params)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool for the duration of the block."""
+        db_pool = self.get_pool()
+        conn = db_pool.getconn()
+        try:
+            yield conn
+        finally:
+            db_pool.putconn(conn)
+
+    def _schema_version(self, conn):
+        cur = conn.cursor()
+        try:
+            cur.execute('SELECT MAX(version) FROM schema_version')
+            version = cur.fetchone()[0] or 0
+        except psycopg2.errors.UndefinedTable:
+            version = 0
+        conn.rollback()
+        cur.close()
+        return version
+
+    def init(self):
+        """Check the schema version; migrate only if this deploy is behind.
+
+        Normally the pre-deploy `flask migrate` has already run, so each
+        worker pays one SELECT instead of a round of DDL.
+        """
+        if self._initialized:
+            return
+        # Creating the pool opens minconn connections at worker boot, so the
+        # first burst of requests does not pay connection setup
+        self.get_pool()
+        with self.connection() as conn:
+            version = self._schema_version(conn)
+        if version < len(POSTGRES_MIGRATIONS):
+            self.migrate()
+        self._initialized = True
+
+    def _lock_migrations(self, conn, cur):
+        """Take the migration advisory lock.
+
+        Polls with pg_try_advisory_lock instead of blocking: a session
+        waiting inside pg_advisory_lock holds a snapshot, which a CREATE
+        INDEX CONCURRENTLY in the lock holder would wait on in turn.
+        """
+        while True:
+            cur.execute('SELECT pg_try_advisory_lock(%s)', (MIGRATION_LOCK_ID,))
+            locked = cur.fetchone()[0]
+            conn.commit()
+            if locked:
+                return
+            time.sleep(0.5)
+
+    def migrate(self):
+        """Apply pending migrations under an advisory lock.
+
+        The session-level lock serializes concurrent runners (several
+        workers or replicas booting at once); whoever gets it second finds
+        nothing left to do. Autocommit statements run outside the
+        migration's transaction; if one fails part-way, drop any INVALID
+        index it left behind before migrating again.
+        """
+        with self.connection() as conn:
+            cur = conn.cursor()
+            self._lock_migrations(conn, cur)
+            try:
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                conn.commit()
+                version = self._schema_version(conn)
+                for number in range(version + 1, len(POSTGRES_MIGRATIONS) + 1):
+                    for statement in POSTGRES_MIGRATIONS[number - 1]:
+                        if isinstance(statement, Autocommit):
+                            conn.commit()
+                            conn.autocommit = True
+                            try:
+                                cur.execute(statement)
+                            finally:
+                                conn.autocommit = False
+                        else:
+                            cur.execute(statement)
+                    cur.execute('INSERT INTO schema_version (version) VALUES (%s)', (number,))
+                    conn.commit()
+                    version = number
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cur.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID,))
+                conn.commit()
+                cur.close()
+        return version
+
+    def load_user(self, user_id):
+        with self.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            self._execute(conn, cur, 'user_by_id',
+                          'SELECT id, google_id, email, name, picture FROM users WHERE id = %s', (user_id,))
+            row = cur.fetchone()
+            cur.close()
+            return dict(row) if row else None
+
+    def get_or_create_user(self, google_id, email, name, picture):
+        # One round trip; concurrent first logins cannot hit a unique violation
+        with self.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            self._execute(conn, cur, 'upsert_user', '''
+                INSERT INTO users (google_id, email, name, picture) VALUES (%s, %s, %s, %s)
+                ON CONFLICT (google_id) DO UPDATE SET name = EXCLUDED.name, picture = EXCLUDED.picture
+                RETURNING id, google_id, email, name, picture
+            ''', (google_id, email, name, picture))
+            user = dict(cur.fetchone())
+            conn.commit()
+            cur.close()
+            return user
+
+    def save_history(self, record, user_id=None):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            self._execute(conn, cur, 'insert_history', 'INSERT INTO history (id, data, user_id) VALUES (%s, %s, %s)',
+                          (record['id'], json.dumps(record), user_id))
+            conn.commit()
+            cur.close()
+
+    def save_history_batch(self, items):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            execute_values(cur, 'INSERT INTO history (id, data, user_id) VALUES %s',
+                           [(record['id'], json.dumps(record), user_id) for record, user_id in items])
+            conn.commit()
+            cur.close()
+
+    def load_history(self, user_id=None, before=None, limit=None, summary=False):
+        with self.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            where = ['user_id = %s' if user_id else 'user_id IS NULL']
+            params = [user_id] if user_id else []
+            position = decode_history_cursor(before)
+            if position:
+                where.append('(created_at, id) < (%s, %s)')
+                params.extend(position)
+            columns = self.SUMMARY_SQL + ' AS data' if summary else 'data'
+            sql = f'SELECT id, created_at, {columns} FROM history WHERE ' + ' AND '.join(where) + \
+                  ' ORDER BY created_at DESC, id DESC'
+            name = None
+            if limit is not None:
+                # Fetch one extra row to learn whether another page exists
+                sql += ' LIMIT %s'
+                params.append(limit + 1)
+                if user_id:
+                    # The paged, per-user variants are the hot ones
+                    name = 'history_' + ('summary' if summary else 'full') + ('_after' if position else '')
+            self._execute(conn, cur, name, sql, params)
+            rows = cur.fetchall()
+            cur.close()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_history_cursor(rows[-1]['created_at'], rows[-1]['id'])
+        return [row['data'] for row in rows], next_cursor
+
+    def get_history_record(self, session_id, user_id=None):
+        with self.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            if user_id:
+                self._execute(conn, cur, 'history_record',
+                              'SELECT data FROM history WHERE id = %s AND user_id = %s', (session_id, user_id))
+            else:
+                cur.execute('SELECT data FROM history WHERE id = %s AND user_id IS NULL', (session_id,))
+            row = cur.fetchone()
+            cur.close()
+            return row['data'] if row else None
+
+
+class SqliteStorage(Storage):
+    """Embedded SQLite storage in WAL mode for single-box installs.
+
+    Each thread keeps its own connection. WAL lets readers in every gunicorn
+    worker proceed while one writer commits, and busy_timeout makes
+    concurrent writers wait for the lock instead of failing.
+    """
+
+    SUMMARY_SQL = 'json_object(' + ', '.join(
+        f"'{field}', json_extract(data, '$.{field}')" for field in HISTORY_SUMMARY_FIELDS) + ')'
+
+    def __init__(self, path, busy_timeout=30):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+    def connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def init(self):
+        """Check PRAGMA user_version; migrate only if behind."""
+        version = self.connect().execute('PRAGMA user_version').fetchone()[0]
+        if version < len(SQLITE_MIGRATIONS):
+            self.migrate()
+
+    def migrate(self):
+        """Apply pending migrations; BEGIN IMMEDIATE serializes workers."""
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for number in range(version + 1, len(SQLITE_MIGRATIONS) + 1):
+                for statement in SQLITE_MIGRATIONS[number - 1]:
+                    conn.execute(statement)
+                version = number
+            # PRAGMA arguments cannot be bound parameters
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return version
+
+    def load_user(self, user_id):
+        row = self.connect().execute(
+            'SELECT id, google_id, email, name, picture FROM users WHERE id = ?', (user_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_or_create_user(self, google_id, email, name, picture):
+        conn = self.connect()
+        with conn:
+            row = conn.execute('''
+                INSERT INTO users (google_id, email, name, picture) VALUES (?, ?, ?, ?)
+                ON CONFLICT (google_id) DO UPDATE SET name = excluded.name, picture = excluded.picture
+                RETURNING id, google_id, email, name, picture
+            ''', (google_id, email, name, picture)).fetchone()
+        return dict(row)
+
+    def save_history(self, record, user_id=None):
+        conn = self.connect()
+        with conn:
+            conn.execute('INSERT INTO history (id, data, user_id, created_at) VALUES (?, ?, ?, ?)',
+                         (record['id'], json.dumps(record), user_id, _now()))
+
+    def save_history_batch(self, items):
+        conn = self.connect()
+        created_at = _now()
+        with conn:
+            conn.executemany('INSERT INTO history (id, data, user_id, created_at) VALUES (?, ?, ?, ?)',
+                             [(record['id'], json.dumps(record), user_id, created_at) for record, user_id in items])
+
+    def load_history(self, user_id=None, before=None, limit=None, summary=False):
+        # "IS ?" matches NULL user_id as well as a given id
+        where = ['user_id IS ?']
+        params = [user_id]
+        position = decode_history_cursor(before)
+        if position:
+            where.append('(created_at, id) < (?, ?)')
+            params.extend([position[0].isoformat(timespec='microseconds'), position[1]])
+        columns = self.SUMMARY_SQL + ' AS data' if summary else 'data'
+        sql = f'SELECT id, created_at, {columns} FROM history WHERE ' + ' AND '.join(where) + \
+              ' ORDER BY created_at DESC, id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit + 1)
+        rows = self.connect().execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_history_cursor(rows[-1]['created_at'], rows[-1]['id'])
+        return [json.loads(row['data']) for row in rows], next_cursor
+
+    def get_history_record(self, session_id, user_id=None):
+        row = self.connect().execute(
+            'SELECT data FROM history WHERE id = ? AND user_id IS ?', (session_id, user_id)).fetchone()
+        return json.loads(row['data']) if row else None
+
+
+def _is_transient(exc):
+    """Whether a failed write may succeed if retried: the database is busy
+    (pool exhausted, SQLite locked) or briefly unreachable."""
+    if isinstance(exc, (PoolTimeout, pool.PoolError, psycopg2.OperationalError)):
+        return True
+    return isinstance(exc, sqlite3.OperationalError) and 'locked' in str(exc)
+
+
+class WriteBehindQueue:
+    """Bounded in-process queue that saves history in batches.
+
+    put() returns as soon as the record is queued. A background thread takes
+    up to batch_size records at a time, waiting at most flush_interval
+    seconds for a batch to fill, and writes them with one
+    save_history_batch() call. If the queue is full, put() writes through
+    synchronously instead of dropping the record. close() drains the queue
+    and runs at interpreter exit, so a graceful worker shutdown loses nothing.
+
+    Transient errors (see _is_transient) keep the batch and retry it with
+    exponential backoff, up to retry_max_delay between attempts; meanwhile
+    the queue fills and put() falls back to writing through. Only records
+    that fail with a permanent error (e.g. a duplicate id) are dropped.
+    """
+
+    # Attempts per write once close() has started, so shutdown can finish
+    CLOSE_ATTEMPTS = 3
+
+    def __init__(self, storage, maxsize=1000, batch_size=50, flush_interval=0.2,
+                 retry_delay=0.5, retry_max_delay=30.0):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self.saved = 0
+        self.batches = 0
+        self.write_through = 0
+        self.retries = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._run, name='history-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, record, user_id=None):
+        with self._close_lock:
+            if not self._closed:
+                try:
+                    self._queue.put_nowait((record, user_id))
+                    return
+                except queue.Full:
+                    pass
+        self.write_through += 1
+        self.storage.save_history(record, user_id)
+
+    def _take_batch(self, timeout):
+        """Block for the first item, then gather more until full or timed out."""
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _retrying(self, save, *args):
+        """Call save(*args), retrying transient errors with backoff.
+
+        Permanent errors are raised at once. Transient ones are retried until
+        the write succeeds, or for CLOSE_ATTEMPTS tries once closing.
+        """
+        delay = self.retry_delay
+        attempts = 0
+        while True:
+            try:
+                return save(*args)
+            except Exception as exc:
+                attempts += 1
+                if not _is_transient(exc) or (self._closed and attempts >= self.CLOSE_ATTEMPTS):
+                    raise
+                self.retries += 1
+                logger.warning('History save failed (%s); retrying in %.1fs', exc, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, self.retry_max_delay)
+
+    def _write(self, batch):
+        failed = 0
+        try:
+            self._retrying(self.storage.save_history_batch, batch)
+        except Exception:
+            # Retry one by one so a single bad record does not sink the batch
+            logger.exception('Batched history save failed; retrying individually')
+            for record, user_id in batch:
+                try:
+                    self._retrying(self.storage.save_history, record, user_id)
+                except Exception:
+                    failed += 1
+                    logger.exception('Dropping history record %s', record.get('id'))
+        self.saved += len(batch) - failed
+        self.errors += failed
+        self.batches += 1
+        for _item in batch:
+            self._queue.task_done()
+
+    def _run(self):
+        while not self._closed:
+            batch = self._take_batch(timeout=1.0)
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Stop accepting records and write out whatever is still queued."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._thread.join()
+        while True:
+            batch = self._take_batch(timeout=0)
+            if not batch:
+                break
+            self._write(batch)
+
+    def stats(self):
+        return {
+            'depth': self._queue.qsize(),
+            'capacity': self._queue.maxsize,
+            'saved': self.saved,
+            'batches': self.batches,
+            'write_through': self.write_through,
+            'retries': self.retries,
+            'errors': self.errors,
+        }
+
+
+def create_storage():
+    """Build the backend named by STORAGE_BACKEND (postgres, sqlite or jsonl).
+
+    Defaults to postgres when DATABASE_URL is set and jsonl otherwise.
+    """
+    database_url = os.environ.get('DATABASE_URL')
+    backend = os.environ.get('STORAGE_BACKEND') or ('postgres' if database_url else 'jsonl')
+    if backend == 'postgres':
+        # Size per worker: Postgres needs max_connections >= DB_POOL_MAX x workers x replicas
+        return PostgresStorage(
+            database_url,
+            minconn=int(os.environ.get('DB_POOL_MIN', 1)),
+            maxconn=int(os.environ.get('DB_POOL_MAX', 10)),
+            acquire_timeout=float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+            validate_after=float(os.environ.get('DB_POOL_VALIDATE_AFTER', 30)),
+            use_prepared=os.environ.get('DB_PREPARED_STATEMENTS', '1').lower() not in ('0', 'false', 'no'),
+        )
+    if backend == 'sqlite':
+        return SqliteStorage(os.environ.get('SQLITE_PATH', 'math.db'))
+    if backend == 'jsonl':
+        return JsonlStorage(os.environ.get('HISTORY_FILE', 'history.jsonl'), legacy_path='history.json')
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")